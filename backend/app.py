@@ -4,11 +4,17 @@ Provides endpoints to fetch data from Azure Databricks.
 Enhanced with caching, pagination, and progressive loading support.
 """
 import os
+import base64
+import hashlib
 import logging
-import json
-from typing import Dict, Any, Optional
-from flask import Flask, jsonify, request
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import orjson
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from flask import Flask, Response, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_caching import Cache
 from databricks_client import databricks_client
 from cache_service import cache_service
 from dotenv import load_dotenv
@@ -23,8 +29,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, so every `jsonify` and `request.get_json` uses it."""
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=str).decode()
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+    
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        # Same argument handling as jsonify: one positional value, several as a list, or kwargs
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        obj = args[0] if len(args) == 1 else (args or kwargs)
+        # Build the body straight from orjson's bytes instead of round-tripping through str
+        return self._app.response_class(orjson.dumps(obj, default=str), mimetype=self.mimetype)
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Configure CORS
 frontend_urls = [
@@ -33,24 +59,358 @@ frontend_urls = [
 ]
 CORS(app, origins=frontend_urls)
 
+# Short-TTL, in-process memoization of GET responses keyed by query string
+RESPONSE_CACHE_TTL = 300
+cache = Cache(app, config={
+    'CACHE_TYPE': 'SimpleCache',
+    'CACHE_DEFAULT_TIMEOUT': RESPONSE_CACHE_TTL
+})
+
+
+def is_success_response(response) -> bool:
+    """Response filter for `cache.cached` so error and streamed responses are never memoized."""
+    return getattr(response, 'status_code', None) == 200 and not getattr(response, 'is_streamed', False)
+
+# Worker pool for running independent Databricks queries concurrently. Its threads live
+# for the whole process, so each keeps its own Databricks connection.
+EXECUTOR = ThreadPoolExecutor(max_workers=4, initializer=databricks_client.thread_initializer)
+
+# Identical queries currently executing, keyed by (query, sorted params)
+_inflight: Dict[Tuple[str, Tuple], Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def coalesced_query(query: str, parameters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Run `databricks_client.execute_query`, sharing one execution among concurrent identical calls.
+    
+    A burst of requests for the same cold page (e.g. several components mounting at once)
+    otherwise fires N identical warehouse queries. The first caller runs the query; the
+    rest wait on its result. Every caller gets its own row dicts, since handlers mutate them.
+    """
+    key = (query, tuple(sorted((parameters or {}).items())))
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = _inflight[key] = Future()
+    
+    if is_leader:
+        try:
+            future.set_result(databricks_client.execute_query(query, parameters=parameters))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+    else:
+        logger.info("🔗 Joining in-flight identical Databricks query")
+    
+    return [dict(row) for row in future.result()]
+
 # SQL query file paths
 SQL_QUERIES_DIR = os.path.join(os.path.dirname(__file__), 'sql_queries')
 HIERARCHY_QUERY_FILE = os.path.join(SQL_QUERIES_DIR, 'hierarchy_query.sql')
 INVESTMENT_QUERY_FILE = os.path.join(SQL_QUERIES_DIR, 'investment_query.sql')
 
 
+def _load_query(path: str) -> str:
+    """Read a SQL file once, without the trailing semicolon so it can be extended."""
+    with open(path, 'r') as f:
+        return f.read().strip().rstrip(';')
+
+
+# The query files never change at runtime, so read them once at import
+HIERARCHY_QUERY = _load_query(HIERARCHY_QUERY_FILE)
+INVESTMENT_QUERY = _load_query(INVESTMENT_QUERY_FILE)
+
+
+# Bounds for the `limit` query arg of the progressive endpoints
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 1000
+
+
+# Keyset cursor: the (CHILD_ID, COE_ROADMAP_PARENT_ID) of the last row of a page,
+# plus the filtered total from the first page so later pages skip the COUNT window.
+# CHILD_ID alone repeats across hierarchy rows, so the parent breaks ties.
+PageCursor = Tuple[str, str, int]
+
+# Sort key columns of hierarchy pages; NULL parents sort (and compare) as ''
+PAGE_ORDER_BY = "CHILD_ID, COALESCE(COE_ROADMAP_PARENT_ID, '')"
+
+
+def encode_cursor(record: Dict[str, Any], total: int) -> str:
+    """Opaque, URL-safe `after` cursor pointing just past a hierarchy row."""
+    key = [record['CHILD_ID'], record.get('COE_ROADMAP_PARENT_ID') or '', total]
+    return base64.urlsafe_b64encode(orjson.dumps(key)).decode().rstrip('=')
+
+
+def decode_cursor(value: str) -> PageCursor:
+    """
+    Inverse of `encode_cursor`.
+    
+    Raises:
+        ValueError: If `value` is not a cursor produced by `encode_cursor`
+    """
+    try:
+        child_id, parent_id, total = orjson.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        return str(child_id), str(parent_id), int(total)
+    except Exception as e:
+        raise ValueError(f"Invalid page cursor: {value!r}") from e
+
+
+def parse_paging_args() -> Tuple[int, int, Optional[PageCursor]]:
+    """
+    Parse `page`, `limit` and the optional keyset cursor `after` from the query string,
+    clamping page and limit to sane bounds.
+    
+    Raises:
+        ValueError: If page or limit is not an integer, or `after` is not a valid cursor
+    """
+    page = max(1, int(request.args.get('page', 1)))
+    limit = min(MAX_PAGE_LIMIT, max(1, int(request.args.get('limit', DEFAULT_PAGE_LIMIT))))
+    after = request.args.get('after')
+    return page, limit, decode_cursor(after) if after else None
+
+
+def invalid_paging_response():
+    """400 response for unparseable `page`/`limit`/`after` arguments."""
+    return jsonify({
+        'status': 'error',
+        'message': 'page and limit must be integers, and after a pagination.next_after cursor',
+        'mode': 'databricks'
+    }), 400
+
+
+def normalize_filter_arg(name: str) -> Optional[str]:
+    """
+    Read an optional filter arg, stripped and lower-cased; None when absent, blank or 'all'.
+    
+    Normalizing keeps 'EMEA ', 'emea' and 'Emea' on one cache entry, so the SQL
+    they feed must compare case-insensitively.
+    """
+    value = (request.args.get(name) or '').strip().lower()
+    return value if value and value != 'all' else None
+
+
+def build_page_clause(page: int, limit: int, after: Optional[PageCursor] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build the trailing clause selecting one page of hierarchy rows, ordered by PAGE_ORDER_BY.
+    
+    When `after` (the cursor of the previous page's last row) is given, keyset pagination
+    seeks past the cursor instead of skipping rows, so cost does not grow with depth as
+    long as the page query omits the COUNT window (see `build_hierarchy_page_query`).
+    Otherwise falls back to OFFSET paging on `page` for existing callers.
+    
+    One row beyond `limit` is fetched as a probe for whether another page exists;
+    pass the results through `trim_page` to drop it.
+    """
+    if after is not None:
+        # (CHILD_ID, parent) > (after_child, after_parent), spelled out as a row comparison
+        clause = (
+            " WHERE CHILD_ID > %(after_child)s"
+            " OR (CHILD_ID = %(after_child)s AND COALESCE(COE_ROADMAP_PARENT_ID, '') > %(after_parent)s)"
+            f" ORDER BY {PAGE_ORDER_BY} LIMIT %(limit)s"
+        )
+        return clause, {'after_child': after[0], 'after_parent': after[1], 'limit': limit + 1}
+    
+    offset = (page - 1) * limit
+    return f" ORDER BY {PAGE_ORDER_BY} LIMIT %(limit)s OFFSET %(offset)s", {'limit': limit + 1, 'offset': offset}
+
+
+def trim_page(
+    hierarchy_results: List[Dict[str, Any]],
+    investment_results: List[Dict[str, Any]],
+    limit: int
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], bool]:
+    """
+    Drop the probe row fetched by `build_page_clause` (and investments only it owns).
+    Returns (hierarchy, investment, has_more).
+    """
+    has_more = len(hierarchy_results) > limit
+    if has_more:
+        hierarchy_results = hierarchy_results[:limit]
+        page_ids = {record['CHILD_ID'] for record in hierarchy_results}
+        investment_results = [record for record in investment_results if record['INV_EXT_ID'] in page_ids]
+    return hierarchy_results, investment_results, has_more
+
+
+def build_hierarchy_page_query(hierarchy_filter: str, page_clause: str, with_total: bool = True) -> str:
+    """
+    Build the query for one page of filtered hierarchy rows.
+    
+    With `with_total`, each row carries a `_total` column with the size of the whole
+    filtered set, computed by a COUNT(*) OVER () window in the same scan. The window
+    is evaluated before the page clause, so it costs a full scan and sort; keyset
+    pages pass with_total=False and take the total from their cursor instead.
+    """
+    total_column = ", COUNT(*) OVER () AS _total" if with_total else ""
+    return f"""
+        SELECT * FROM (
+            SELECT *{total_column}
+            FROM ({HIERARCHY_QUERY}) hierarchy_base
+            WHERE {hierarchy_filter}
+        ) counted_hierarchy{page_clause}
+    """
+
+
+def build_combined_query(hierarchy_filter: str, page_clause: str, with_total: bool = True) -> str:
+    """
+    Build a single query returning a page of hierarchy rows together with their
+    investment rows, so each progressive endpoint needs one Databricks round-trip.
+    
+    Both row shapes are serialized to a JSON `payload` column next to a `kind`
+    discriminator ('H' = hierarchy, 'I' = investment) because the two queries
+    do not share a column layout and cannot be UNIONed directly.
+    """
+    return f"""
+        WITH h AS (
+            {build_hierarchy_page_query(hierarchy_filter, page_clause, with_total)}
+        ),
+        inv AS (
+            SELECT * FROM ({INVESTMENT_QUERY}) investment_base
+        )
+        SELECT 'H' AS kind, to_json(struct(h.*), map('ignoreNullFields', 'false')) AS payload FROM h
+        UNION ALL
+        SELECT 'I' AS kind, to_json(struct(inv.*), map('ignoreNullFields', 'false')) AS payload
+        FROM inv JOIN (SELECT DISTINCT CHILD_ID FROM h) page_ids ON inv.INV_EXT_ID = page_ids.CHILD_ID
+    """
+
+
+def split_combined_results(rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Partition the rowset of a combined query into (hierarchy, investment) records."""
+    hierarchy_results = []
+    investment_results = []
+    
+    for row in rows:
+        record = orjson.loads(row['payload'])
+        if row['kind'] == 'H':
+            hierarchy_results.append(record)
+        else:
+            investment_results.append(record)
+    
+    # UNION ALL does not preserve the page order of the hierarchy CTE
+    hierarchy_results.sort(key=lambda record: (record['CHILD_ID'], record.get('COE_ROADMAP_PARENT_ID') or ''))
+    return hierarchy_results, investment_results
+
+
+def pop_total(hierarchy_results: List[Dict[str, Any]], after: Optional[PageCursor] = None) -> int:
+    """
+    Strip the `_total` window column from a hierarchy page and return its value.
+    Keyset pages are fetched without the window and report the total carried by `after`.
+    """
+    if after is not None:
+        return after[2]
+    total = hierarchy_results[0]['_total'] if hierarchy_results else 0
+    for record in hierarchy_results:
+        record.pop('_total', None)
+    return total
+
+
+# Rows per chunk when streaming large JSON arrays
+STREAM_BATCH_SIZE = 1000
+
+
+def iter_json_array(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Yield the comma-separated orjson encoding of `rows` in batches (without brackets)."""
+    batch = []
+    first = True
+    for row in rows:
+        batch.append(orjson.dumps(row, default=str))
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield (b'' if first else b',') + b','.join(batch)
+            first = False
+            batch = []
+    
+    if batch:
+        yield (b'' if first else b',') + b','.join(batch)
+
+
+def iter_ndjson(kind: str, rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Yield one `{"kind": ..., "record": ...}` line per row, batched like `iter_json_array`."""
+    batch = []
+    for row in rows:
+        batch.append(orjson.dumps({'kind': kind, 'record': row}, default=str, option=orjson.OPT_APPEND_NEWLINE))
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield b''.join(batch)
+            batch = []
+    
+    if batch:
+        yield b''.join(batch)
+
+
+def close_stream_futures(futures: Iterable[Future]) -> None:
+    """Wait for submitted `execute_query_stream` calls and close every stream that opened."""
+    for future in futures:
+        if future.exception() is not None:
+            continue  # Never opened; execute_query_stream already closed its connection
+        try:
+            future.result().close()
+        except Exception as e:
+            logger.warning(f"Could not close query stream: {str(e)}")
+
+
+def wants_ndjson() -> bool:
+    """Whether the client asked for newline-delimited JSON via `?format=ndjson`."""
+    return request.args.get('format') == 'ndjson'
+
+
+def ndjson_response(header: Dict[str, Any], sections: Dict[str, Iterable[Dict[str, Any]]]) -> Response:
+    """
+    Stream a response as NDJSON: the `header` object first, then one line per record of
+    each section, tagged with the section name. Nothing is buffered beyond one batch.
+    """
+    def generate():
+        yield orjson.dumps(header, default=str, option=orjson.OPT_APPEND_NEWLINE)
+        for kind, rows in sections.items():
+            yield from iter_ndjson(kind, rows)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def respond_rows(response_data: Dict[str, Any]) -> Response:
+    """
+    Send a progressive-endpoint response as JSON, or as NDJSON for `?format=ndjson`.
+    In NDJSON the first line is the envelope with everything but the row lists.
+    """
+    if not wants_ndjson():
+        return jsonify(response_data)
+    
+    data = response_data['data']
+    sections = {kind: rows for kind, rows in data.items() if isinstance(rows, list)}
+    header = {**response_data, 'data': {k: v for k, v in data.items() if k not in sections}}
+    return ndjson_response(header, sections)
+
+
+@app.after_request
+def add_conditional_get(response: Response) -> Response:
+    """
+    Tag successful /api/data GET responses with an ETag of their body and answer a
+    matching If-None-Match with an empty 304, so unchanged pages are not re-sent.
+    """
+    if (request.method == 'GET' and request.path.startswith('/api/data')
+            and response.status_code == 200 and not response.is_streamed):
+        if 'ETag' not in response.headers:
+            response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest())
+        response.make_conditional(request)
+    return response
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({
+    response = jsonify({
         'status': 'healthy',
         'message': 'PMO Portfolio API is running',
         'version': '1.0.0',
         'mode': 'databricks'
     })
+    response.headers['Cache-Control'] = 'public, max-age=5'
+    return response
 
 
 @app.route('/api/test-connection', methods=['GET'])
+@cache.cached(timeout=10)  # Absorb probe traffic; failures are memoized too so probes can't hammer a down warehouse
 def test_databricks_connection():
     """Test Databricks connection endpoint."""
     
@@ -85,50 +445,33 @@ def test_databricks_connection():
 # =============================================================================
 
 @app.route('/api/data/portfolio', methods=['GET'])
+@cache.cached(timeout=RESPONSE_CACHE_TTL, query_string=True, response_filter=is_success_response)
 def get_portfolio_data():
     """Get paginated portfolio-level data with a proper filter for high performance."""
     try:
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
-        
-        logger.info(f"Fetching portfolio data - Page: {page}, Limit: {limit}")
+        try:
+            page, limit, after = parse_paging_args()
+        except ValueError:
+            return invalid_paging_response()
         
-        # 1. Read the base hierarchy query
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read().strip().rstrip(';')
+        logger.info(f"Fetching portfolio data - Page: {page}, Limit: {limit}, After: {after}")
         
-        # 2. CRITICAL FIX: Add a WHERE clause to only select top-level portfolios.
+        # 1. CRITICAL FIX: Only select top-level portfolios, paginated.
         # This is the key to making the query fast.
-        hierarchy_query += " WHERE COE_ROADMAP_TYPE = 'Portfolio'"
+        page_clause, page_params = build_page_clause(page, limit, after)
+        combined_query = build_combined_query("COE_ROADMAP_TYPE = 'Portfolio'", page_clause, with_total=after is None)
 
-        # 3. Add pagination to the already filtered query
-        offset = (page - 1) * limit
-        hierarchy_query += f" ORDER BY CHILD_ID LIMIT {limit} OFFSET {offset}"
-        
-        # 4. Execute the fast, filtered query. Caching is handled automatically by databricks_client.
-        hierarchy_results = databricks_client.execute_query(hierarchy_query)
-        
-        investment_results = []
-        
-        # 5. CRITICAL FIX: Only get investment data for the portfolios we fetched
-        # This prevents non-portfolio records from appearing on the Portfolio page
-        if hierarchy_results:
-            # Extract portfolio IDs from hierarchy results
-            portfolio_ids = [row['CHILD_ID'] for row in hierarchy_results]
-            portfolio_ids_str = "', '".join(portfolio_ids)
-            
-            with open(INVESTMENT_QUERY_FILE, 'r') as f:
-                investment_query = f.read().strip().rstrip(';')
+        # 2. Fetch the portfolio page and ONLY its investment records in one round-trip.
+        # This prevents non-portfolio records from appearing on the Portfolio page.
+        # Caching is handled automatically by databricks_client.
+        combined_results = coalesced_query(combined_query, parameters=page_params)
+        hierarchy_results, investment_results = split_combined_results(combined_results)
+        total_items = pop_total(hierarchy_results, after)
+        hierarchy_results, investment_results, has_more = trim_page(hierarchy_results, investment_results, limit)
 
-            # Add WHERE clause to filter investment data by portfolio IDs only
-            investment_query += f" WHERE INV_EXT_ID IN ('{portfolio_ids_str}')"
-            
-            # Execute the filtered investment query to get only portfolio-related investment records
-            investment_results = databricks_client.execute_query(investment_query)
-            
-            logger.info(f"Filtered investment query for {len(portfolio_ids)} portfolios, got {len(investment_results)} investment records")
+        logger.info(f"Combined query returned {len(hierarchy_results)} portfolios and {len(investment_results)} investment records")
 
-        # 6. Structure and return the response
+        # 3. Structure and return the response
         response_data = {
             'status': 'success',
             'data': {
@@ -137,14 +480,16 @@ def get_portfolio_data():
                 'pagination': {
                     'page': page,
                     'limit': limit,
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+                    'after': request.args.get('after'),
+                    'next_after': encode_cursor(hierarchy_results[-1], total_items) if hierarchy_results else None,
+                    'total_items': total_items,
+                    'has_more': has_more
                 }
             },
             'mode': 'databricks'
         }
         
-        return jsonify(response_data)
+        return respond_rows(response_data)
         
     except Exception as e:
         logger.error(f"Error in get_portfolio_data: {str(e)}")
@@ -156,46 +501,35 @@ def get_portfolio_data():
 
 
 @app.route('/api/data/program', methods=['GET'])
+@cache.cached(timeout=RESPONSE_CACHE_TTL, query_string=True, response_filter=is_success_response)
 def get_program_data():
     """Get paginated program-level data supporting both 'All Programs' and drill-through scenarios."""
     try:
         portfolio_id = request.args.get('portfolioId')  # Make this optional
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
+        try:
+            page, limit, after = parse_paging_args()
+        except ValueError:
+            return invalid_paging_response()
         
         if portfolio_id:
-            logger.info(f"Fetching program data for specific portfolio: {portfolio_id}, Page: {page}, Limit: {limit}")
+            logger.info(f"Fetching program data for specific portfolio: {portfolio_id}, Page: {page}, Limit: {limit}, After: {after}")
         else:
-            logger.info(f"Fetching ALL program data - Page: {page}, Limit: {limit}")
-        
-        # Read the base hierarchy query
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read().strip().rstrip(';')
+            logger.info(f"Fetching ALL program data - Page: {page}, Limit: {limit}, After: {after}")
         
         # Always filter for Program and SubProgram records
-        hierarchy_query += " WHERE COE_ROADMAP_TYPE IN ('Program', 'SubProgram')"
-        
-        # If a specific portfolio is provided, add additional filtering
-        # Note: The actual portfolio filtering will be done in the frontend using the same
-        # logic as apiDataService.js to ensure consistency
-        
-        # Add pagination to the filtered query
-        offset = (page - 1) * limit
-        hierarchy_query += f" ORDER BY CHILD_ID LIMIT {limit} OFFSET {offset}"
-        
-        # Execute the hierarchy query
-        hierarchy_results = databricks_client.execute_query(hierarchy_query)
-        
-        # Get ALL investment data (same as successful portfolio endpoint)
-        # This matches the working portfolio approach - fetch all investments and let frontend filter
-        investment_results = []
-        if hierarchy_results or not portfolio_id:  # Always fetch investments for "All Programs" view
-            with open(INVESTMENT_QUERY_FILE, 'r') as f:
-                investment_query = f.read().strip().rstrip(';')
+        # If a specific portfolio is provided, the actual portfolio filtering will be done
+        # in the frontend using the same logic as apiDataService.js to ensure consistency
+        page_clause, page_params = build_page_clause(page, limit, after)
+        combined_query = build_combined_query("COE_ROADMAP_TYPE IN ('Program', 'SubProgram')", page_clause, with_total=after is None)
 
-            # Execute the full investment query to get all investment records
-            # Frontend will do the matching logic based on INV_EXT_ID === CHILD_ID
-            investment_results = databricks_client.execute_query(investment_query)
+        # Fetch the program page and its investment records in one round-trip
+        # (same as successful portfolio endpoint). Frontend still matches on INV_EXT_ID === CHILD_ID.
+        # Investments are joined to this page's CHILD_IDs only, so a page past the end of the
+        # data (zero hierarchy rows) returns no investments instead of the whole table.
+        combined_results = coalesced_query(combined_query, parameters=page_params)
+        hierarchy_results, investment_results = split_combined_results(combined_results)
+        total_items = pop_total(hierarchy_results, after)
+        hierarchy_results, investment_results, has_more = trim_page(hierarchy_results, investment_results, limit)
 
         # Structure and return the response
         response_data = {
@@ -206,15 +540,17 @@ def get_program_data():
                 'pagination': {
                     'page': page,
                     'limit': limit,
+                    'after': request.args.get('after'),
+                    'next_after': encode_cursor(hierarchy_results[-1], total_items) if hierarchy_results else None,
                     'portfolio_id': portfolio_id,  # Can be null for "All Programs"
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+                    'total_items': total_items,
+                    'has_more': has_more
                 }
             },
             'mode': 'databricks'
         }
         
-        return jsonify(response_data)
+        return respond_rows(response_data)
         
     except Exception as e:
         logger.error(f"Error in get_program_data: {str(e)}")
@@ -225,103 +561,69 @@ def get_program_data():
         }), 500
 
 
-@app.route('/api/data/subprogram', methods=['GET'])
-def get_subprogram_data():
-    """
-    Get paginated sub-program data. Handles both an "All Sub-Programs" view 
-    and a filtered drill-through view from a specific program.
-    """
+# Upper bound on parent IDs accepted by the bulk endpoints (one bind marker each)
+MAX_BULK_IDS = 200
+
+
+@app.route('/api/data/programs_bulk', methods=['GET'])
+@cache.cached(timeout=RESPONSE_CACHE_TTL, query_string=True, response_filter=is_success_response)
+def get_programs_bulk_data():
+    """Get programs for several portfolios in one query, grouped by parent portfolio ID."""
     try:
-        program_id = request.args.get('programId')  # Optional
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
+        portfolio_ids = list(dict.fromkeys(
+            portfolio_id.strip() for portfolio_id in request.args.get('portfolioIds', '').split(',') if portfolio_id.strip()
+        ))
+        if not portfolio_ids or len(portfolio_ids) > MAX_BULK_IDS:
+            return jsonify({
+                'status': 'error',
+                'message': f'portfolioIds must list between 1 and {MAX_BULK_IDS} comma-separated IDs',
+                'mode': 'databricks'
+            }), 400
         
-        logger.info(f"Fetching sub-program data. Program ID: {program_id or 'All'}, Page: {page}, Limit: {limit}")
+        try:
+            page, limit, after = parse_paging_args()
+        except ValueError:
+            return invalid_paging_response()
         
-        # Build the hierarchy query with a secure, conditional filter
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read().strip().rstrip(';')
-
-        # Base filter for the 'Sub-Program' record type. Note the hyphen.
-        hierarchy_query += " WHERE COE_ROADMAP_TYPE = 'Sub-Program'"
-
-        # If a specific program is provided, add additional filtering
-        if program_id:
-            hierarchy_query += f" AND COE_ROADMAP_PARENT_ID = '{program_id}'"
+        logger.info(f"Fetching program data for {len(portfolio_ids)} portfolios - Page: {page}, Limit: {limit}, After: {after}")
         
-        # Add pagination to the filtered query
-        offset = (page - 1) * limit
-        hierarchy_query += f" ORDER BY CHILD_ID LIMIT {limit} OFFSET {offset}"
+        # One query for every requested portfolio instead of one request per portfolio
+        id_placeholders = ', '.join(['%(pid' + str(i) + ')s' for i in range(len(portfolio_ids))])
+        hierarchy_filter = f"COE_ROADMAP_TYPE IN ('Program', 'SubProgram') AND COE_ROADMAP_PARENT_ID IN ({id_placeholders})"
         
-        # Execute the hierarchy query
-        hierarchy_results = databricks_client.execute_query(hierarchy_query)
-        logger.info(f"Found {len(hierarchy_results)} Sub-Program records")
+        page_clause, page_params = build_page_clause(page, limit, after)
+        page_params.update({f'pid{i}': portfolio_id for i, portfolio_id in enumerate(portfolio_ids)})
+        combined_query = build_combined_query(hierarchy_filter, page_clause, with_total=after is None)
+        
+        combined_results = coalesced_query(combined_query, parameters=page_params)
+        hierarchy_results, investment_results = split_combined_results(combined_results)
+        total_items = pop_total(hierarchy_results, after)
+        hierarchy_results, investment_results, has_more = trim_page(hierarchy_results, investment_results, limit)
+        
+        # Group programs by parent portfolio, and each investment under its program's portfolio
+        programs = {portfolio_id: {'hierarchy': [], 'investment': []} for portfolio_id in portfolio_ids}
+        # A CHILD_ID can sit under several of the requested portfolios
+        parents_by_child = {}
+        for record in hierarchy_results:
+            parents_by_child.setdefault(record['CHILD_ID'], set()).add(record['COE_ROADMAP_PARENT_ID'])
+            programs[record['COE_ROADMAP_PARENT_ID']]['hierarchy'].append(record)
+        
+        for record in investment_results:
+            for portfolio_id in parents_by_child[record['INV_EXT_ID']]:
+                programs[portfolio_id]['investment'].append(record)
         
-        # Fetch investment data ONLY for the sub-programs found on the current page
-        subprogram_ids = [record['CHILD_ID'] for record in hierarchy_results]
-        investment_results = []
-
-        if subprogram_ids:
-            logger.info(f"Fetching investment data for subprogram IDs: {subprogram_ids}")
-            
-            with open(INVESTMENT_QUERY_FILE, 'r') as f:
-                investment_query = f.read().strip().rstrip(';')
-
-            # Use simple string formatting for IN clause (secure since we control the IDs)
-            if subprogram_ids:
-                id_placeholders = ', '.join([f"'{pid}'" for pid in subprogram_ids])
-                investment_query += f" WHERE INV_EXT_ID IN ({id_placeholders})"
-                
-                # Debug the actual query being executed
-                logger.info(f"🎯 BACKEND DEBUG: About to execute investment query with filter for PROG000201")
-                logger.info(f"🎯 BACKEND DEBUG: Query length: {len(investment_query)} chars")
-                
-                investment_results = databricks_client.execute_query(investment_query)
-                logger.info(f"Found {len(investment_results)} investment records for subprograms")
-                
-                # Debug ALL investment records for PROG000201 specifically
-                all_prog201_records = [inv for inv in investment_results if inv.get('INV_EXT_ID') == 'PROG000201']
-                if all_prog201_records:
-                    logger.info(f"🎯 BACKEND DEBUG: Found {len(all_prog201_records)} total PROG000201 investment records")
-                    for i, record in enumerate(all_prog201_records):
-                        logger.info(f"🎯 BACKEND DEBUG: Record {i+1} - ROADMAP_ELEMENT: {record.get('ROADMAP_ELEMENT')}, TASK_NAME: {record.get('TASK_NAME')}, INVESTMENT_NAME: {record.get('INVESTMENT_NAME')}")
-                else:
-                    logger.warning("🎯 BACKEND DEBUG: NO PROG000201 investment records found in query results!")
-                
-                # Debug CaTAlyst specifically
-                catalyst_records = [inv for inv in investment_results if inv.get('INV_EXT_ID') == 'PROG000201']
-                if catalyst_records:
-                    logger.info(f"🎯 BACKEND DEBUG: Found {len(catalyst_records)} CaTAlyst investment records by INV_EXT_ID")
-                    for record in catalyst_records:
-                        logger.info(f"🎯 BACKEND DEBUG: CaTAlyst record - ROADMAP_ELEMENT: {record.get('ROADMAP_ELEMENT')}, TASK_NAME: {record.get('TASK_NAME')}")
-                else:
-                    logger.warning("🎯 BACKEND DEBUG: NO CaTAlyst investment records found by INV_EXT_ID!")
-                    
-                    # Check if CaTAlyst exists by PROJECT_NAME
-                    catalyst_by_name = [inv for inv in investment_results if 'CaTAlyst' in str(inv.get('PROJECT_NAME', '')).upper()]
-                    if catalyst_by_name:
-                        logger.info(f"🎯 BACKEND DEBUG: Found {len(catalyst_by_name)} CaTAlyst records by PROJECT_NAME")
-                        for record in catalyst_by_name[:3]:  # Show first 3
-                            logger.info(f"🎯 BACKEND DEBUG: CaTAlyst by name - INV_EXT_ID: {record.get('INV_EXT_ID')}, PROJECT_NAME: {record.get('PROJECT_NAME')}, ROADMAP_ELEMENT: {record.get('ROADMAP_ELEMENT')}")
-                    else:
-                        logger.warning("🎯 BACKEND DEBUG: NO CaTAlyst investment records found by PROJECT_NAME either!")
-                    
-                    # Log sample INV_EXT_ID values to debug mismatch
-                    sample_ids = list(set([inv.get('INV_EXT_ID') for inv in investment_results[:10]]))
-                    logger.info(f"🎯 BACKEND DEBUG: Sample INV_EXT_ID values: {sample_ids}")
-
-        # Structure and return the response
         response_data = {
             'status': 'success',
             'data': {
-                'hierarchy': hierarchy_results,
-                'investment': investment_results,
+                'programs': programs,
                 'pagination': {
                     'page': page,
                     'limit': limit,
-                    'program_id': program_id,
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+                    'after': request.args.get('after'),
+                    'next_after': encode_cursor(hierarchy_results[-1], total_items) if hierarchy_results else None,
+                    'portfolio_ids': portfolio_ids,
+                    'total_items': total_items,
+                    'has_more': has_more
                 }
             },
             'mode': 'databricks'
@@ -330,13 +632,74 @@ def get_subprogram_data():
         return jsonify(response_data)
         
     except Exception as e:
-        logger.error(f"Error in get_subprogram_data: {str(e)}")
+        logger.error(f"Error in get_programs_bulk_data: {str(e)}")
         return jsonify({
             'status': 'error',
-            'message': f'Failed to fetch subprogram data: {str(e)}',
+            'message': f'Failed to fetch bulk program data: {str(e)}',
             'mode': 'databricks'
         }), 500
 
+
+@app.route('/api/data/subprogram', methods=['GET'])
+@cache.cached(timeout=RESPONSE_CACHE_TTL, query_string=True, response_filter=is_success_response)
+def get_subprogram_data():
+    """
+    Get paginated sub-program data. Handles both an "All Sub-Programs" view 
+    and a filtered drill-through view from a specific program.
+    """
+    try:
+        program_id = request.args.get('programId')  # Optional
+        try:
+            page, limit, after = parse_paging_args()
+        except ValueError:
+            return invalid_paging_response()
+        
+        logger.info(f"Fetching sub-program data. Program ID: {program_id or 'All'}, Page: {page}, Limit: {limit}, After: {after}")
+        
+        # Base filter for the 'Sub-Program' record type. Note the hyphen.
+        hierarchy_filter = "COE_ROADMAP_TYPE = 'Sub-Program'"
+
+        # If a specific program is provided, add additional filtering
+        page_clause, page_params = build_page_clause(page, limit, after)
+        if program_id:
+            hierarchy_filter += " AND COE_ROADMAP_PARENT_ID = %(program_id)s"
+            page_params['program_id'] = program_id
+        
+        # Fetch the sub-program page and ONLY its investment records in one round-trip
+        combined_query = build_combined_query(hierarchy_filter, page_clause, with_total=after is None)
+        
+        combined_results = coalesced_query(combined_query, parameters=page_params)
+        hierarchy_results, investment_results = split_combined_results(combined_results)
+        total_items = pop_total(hierarchy_results, after)
+        hierarchy_results, investment_results, has_more = trim_page(hierarchy_results, investment_results, limit)
+        logger.info(f"Found {len(hierarchy_results)} Sub-Program records and {len(investment_results)} investment records")
+
+        # PROG000201 (CaTAlyst) diagnostics scan every investment row, so only run them when debugging
+        if hierarchy_results and logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"🎯 BACKEND DEBUG: Combined query length: {len(combined_query)} chars")
+            
+            # Debug ALL investment records for PROG000201 (CaTAlyst) specifically
+            all_prog201_records = [inv for inv in investment_results if inv.get('INV_EXT_ID') == 'PROG000201']
+            if all_prog201_records:
+                logger.debug(f"🎯 BACKEND DEBUG: Found {len(all_prog201_records)} total PROG000201 investment records")
+                for i, record in enumerate(all_prog201_records):
+                    logger.debug(f"🎯 BACKEND DEBUG: Record {i+1} - ROADMAP_ELEMENT: {record.get('ROADMAP_ELEMENT')}, TASK_NAME: {record.get('TASK_NAME')}, INVESTMENT_NAME: {record.get('INVESTMENT_NAME')}")
+            else:
+                logger.debug("🎯 BACKEND DEBUG: NO PROG000201 investment records found in query results!")
+                
+                # Check if CaTAlyst exists by PROJECT_NAME
+                catalyst_by_name = [inv for inv in investment_results if 'CATALYST' in str(inv.get('PROJECT_NAME', '')).upper()]
+                if catalyst_by_name:
+                    logger.debug(f"🎯 BACKEND DEBUG: Found {len(catalyst_by_name)} CaTAlyst records by PROJECT_NAME")
+                    for record in catalyst_by_name[:3]:  # Show first 3
+                        logger.debug(f"🎯 BACKEND DEBUG: CaTAlyst by name - INV_EXT_ID: {record.get('INV_EXT_ID')}, PROJECT_NAME: {record.get('PROJECT_NAME')}, ROADMAP_ELEMENT: {record.get('ROADMAP_ELEMENT')}")
+                else:
+                    logger.debug("🎯 BACKEND DEBUG: NO CaTAlyst investment records found by PROJECT_NAME either!")
+                
+                # Log sample INV_EXT_ID values to debug mismatch
+                sample_ids = list(set([inv.get('INV_EXT_ID') for inv in investment_results[:10]]))
+                logger.debug(f"🎯 BACKEND DEBUG: Sample INV_EXT_ID values: {sample_ids}")
+
         # Structure and return the response
         response_data = {
             'status': 'success',
@@ -346,15 +709,17 @@ def get_subprogram_data():
                 'pagination': {
                     'page': page,
                     'limit': limit,
-                    'program_id': program_id,  # Can be null for "All SubPrograms"
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+                    'after': request.args.get('after'),
+                    'next_after': encode_cursor(hierarchy_results[-1], total_items) if hierarchy_results else None,
+                    'program_id': program_id,
+                    'total_items': total_items,
+                    'has_more': has_more
                 }
             },
             'mode': 'databricks'
         }
         
-        return jsonify(response_data)
+        return respond_rows(response_data)
         
     except Exception as e:
         logger.error(f"Error in get_subprogram_data: {str(e)}")
@@ -369,79 +734,99 @@ def get_subprogram_data():
 def get_region_data():
     """Get paginated region-filtered data using a correct and efficient two-step fetch."""
     try:
-        region = request.args.get('region')  # Optional
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 50))
-        
-        logger.info(f"Fetching region data. Region: {region or 'All'}, Page: {page}, Limit: {limit}")
+        region = normalize_filter_arg('region')  # Optional
+        market = normalize_filter_arg('market')  # Optional
+        function = normalize_filter_arg('function')  # Optional
+        tier = normalize_filter_arg('tier')  # Optional
+        try:
+            page, limit, after = parse_paging_args()
+        except ValueError:
+            return invalid_paging_response()
+        
+        logger.info(f"Fetching region data. Region: {region or 'All'}, Market: {market or 'All'}, Function: {function or 'All'}, Tier: {tier or 'All'}, Page: {page}, Limit: {limit}, After: {after}")
 
-        # Build cache key based on whether region is specified
-        cache_key = f"region_data_{region or 'all'}_p{page}_l{limit}"
+        # Build cache key based on which filters are specified
+        cache_key = f"region_data_{region or 'all'}_{market or 'all'}_{function or 'all'}_{tier or 'all'}_p{page}_l{limit}_a{request.args.get('after', '')}"
         
-        # Check cache first
-        cached_data = cache_service.get(cache_key)
-        if cached_data:
-            logger.info(f"Serving region data from cache: {cache_key}")
-            return jsonify(cached_data)
-
-        # Step 1: Fetch a page of HIERARCHY records, filtered by region if provided.
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read().strip().rstrip(';')
-
-        params = {}
-        where_clauses = ["COE_ROADMAP_TYPE IN ('Sub-Program', 'Project')"]  # Fetch relevant types
-
-        if region and region.lower() != 'all':
-            # TEMPORARY: Frontend filtering for now since SPLIT function causes issues
-            # When region filtering is needed in backend, implement proper column filtering
-            pass  # Frontend will handle region filtering for now
-        
-        hierarchy_query += " WHERE " + " AND ".join(where_clauses)
-        
-        offset = (page - 1) * limit
-        hierarchy_query += f" ORDER BY CHILD_ID LIMIT {limit} OFFSET {offset}"
-        
-        hierarchy_results = databricks_client.execute_query(hierarchy_query, parameters=params)
-        
-        # Step 2: Take the IDs from Step 1 and fetch ONLY their corresponding investment records.
-        item_ids = [record['CHILD_ID'] for record in hierarchy_results]
-        investment_results = []
-
-        if item_ids:
-            with open(INVESTMENT_QUERY_FILE, 'r') as f:
-                investment_query = f.read().strip().rstrip(';')
-
-            # Use secure parameterized queries for the IN clause
-            id_placeholders = ', '.join(['%(id' + str(i) + ')s' for i in range(len(item_ids))])
-            params_investment = {f'id{i}': pid for i, pid in enumerate(item_ids)}
+        def load_response():
+            # Step 1: Fetch a page of HIERARCHY records, filtered by region if provided.
+            params = {}
+            where_clauses = ["COE_ROADMAP_TYPE IN ('Sub-Program', 'Project')"]  # Fetch relevant types
+            
+            page_clause, page_params = build_page_clause(page, limit, after)
+            hierarchy_query = build_hierarchy_page_query(" AND ".join(where_clauses), page_clause, with_total=after is None)
+            params.update(page_params)
             
-            investment_query += f" WHERE INV_EXT_ID IN ({id_placeholders})"
-            investment_results = databricks_client.execute_query(investment_query, parameters=params_investment)
+            hierarchy_results = coalesced_query(hierarchy_query, parameters=params)
+            total_items = pop_total(hierarchy_results, after)
+            hierarchy_results, _, has_more = trim_page(hierarchy_results, [], limit)
+            
+            # Step 2: Take the IDs from Step 1 and fetch ONLY their corresponding investment records.
+            # A CHILD_ID can repeat across hierarchy rows; dedupe (preserving order) before binding
+            item_ids = list(dict.fromkeys(record['CHILD_ID'] for record in hierarchy_results))
+            investment_results = []
 
-        response_data = {
-            'status': 'success',
-            'data': {
-                'hierarchy': hierarchy_results,
-                'investment': investment_results,
-                'pagination': {
-                    'page': page,
-                    'limit': limit,
-                    'region': region or 'All',
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+            if item_ids:
+                # Use secure parameterized queries for the IN clause
+                id_placeholders = ', '.join(['%(id' + str(i) + ')s' for i in range(len(item_ids))])
+                params_investment = {f'id{i}': pid for i, pid in enumerate(item_ids)}
+                investment_where = [f"INV_EXT_ID IN ({id_placeholders})"]
+                
+                # Push region/market/function/tier filters down to Databricks.
+                # INV_MARKET is stored as 'REGION/MARKET' (or just 'REGION'). Filter values are
+                # already lower-cased, so compare against lower-cased columns.
+                if region:
+                    investment_where.append("(LOWER(INV_MARKET) LIKE %(region_prefix)s OR LOWER(INV_MARKET) = %(region_exact)s)")
+                    params_investment['region_prefix'] = f'{region}/%'
+                    params_investment['region_exact'] = region
+                
+                if market:
+                    investment_where.append("LOWER(INV_MARKET) LIKE %(market_suffix)s")
+                    params_investment['market_suffix'] = f'%/{market}'
+                
+                if function:
+                    investment_where.append("LOWER(INV_FUNCTION) = %(function)s")
+                    params_investment['function'] = function
+                
+                if tier:
+                    investment_where.append("LOWER(CAST(INV_TIER AS STRING)) = %(tier)s")
+                    params_investment['tier'] = tier
+                
+                # Wrap the query so the filters apply to both branches of its trailing UNION
+                investment_query = f"SELECT * FROM ({INVESTMENT_QUERY}) investment_base WHERE " + " AND ".join(investment_where)
+                investment_results = coalesced_query(investment_query, parameters=params_investment)
+
+            response_data = {
+                'status': 'success',
+                'data': {
+                    'hierarchy': hierarchy_results,
+                    'investment': investment_results,
+                    'pagination': {
+                        'page': page,
+                        'limit': limit,
+                        'after': request.args.get('after'),
+                        'next_after': encode_cursor(hierarchy_results[-1], total_items) if hierarchy_results else None,
+                        'region': region or 'All',
+                        'market': market or 'All',
+                        'function': function or 'All',
+                        'tier': tier or 'All',
+                        'total_items': total_items,
+                        'has_more': has_more
+                    }
+                },
+                'mode': 'databricks',
+                'cache_info': {
+                    'cached': False,
+                    'cache_key': cache_key
                 }
-            },
-            'mode': 'databricks',
-            'cache_info': {
-                'cached': False,
-                'cache_key': cache_key
             }
-        }
+            
+            return response_data
         
-        # Cache the response
-        cache_service.set(cache_key, response_data, ttl=300)
+        # Only one request per cold key runs the queries; concurrent ones wait for its result
+        response_data = cache_service.get_or_compute(cache_key, load_response, ttl=300)
         
-        return jsonify(response_data)
+        return respond_rows(response_data)
         
     except Exception as e:
         logger.error(f"Error in get_region_data: {str(e)}")
@@ -470,62 +855,63 @@ def get_region_filter_options():
         # Get actual filter options from the same investment query used for data
         # This ensures filter options match the available data
         
-        # Read the investment query file
-        with open(INVESTMENT_QUERY_FILE, 'r') as f:
-            investment_query = f.read().strip().rstrip(';')
-        
         # Modify query to get unique filter values
         filter_query = f"""
         WITH base_data AS (
-            {investment_query}
+            {INVESTMENT_QUERY}
+        ),
+        split_data AS (
+            SELECT
+                LOCATE('/', INV_MARKET) AS slash_pos,
+                INV_MARKET,
+                INV_FUNCTION,
+                INV_TIER
+            FROM base_data
+            WHERE INV_MARKET IS NOT NULL
+            AND INV_MARKET != ''
+        ),
+        facet_data AS (
+            SELECT
+                CASE 
+                    WHEN INV_MARKET = '-Unrecognised-' THEN 'Unrecognised'
+                    WHEN slash_pos > 0 THEN SUBSTR(INV_MARKET, 1, slash_pos - 1)
+                    ELSE INV_MARKET
+                END as region,
+                CASE 
+                    WHEN INV_MARKET = '-Unrecognised-' THEN 'Unrecognised'
+                    WHEN slash_pos > 0 THEN SUBSTR(INV_MARKET, slash_pos + 1)
+                    ELSE 'Unknown'
+                END as market,
+                INV_FUNCTION as function,
+                CAST(INV_TIER as STRING) as tier
+            FROM split_data
         )
-        SELECT DISTINCT
-            CASE 
-                WHEN INV_MARKET = '-Unrecognised-' THEN 'Unrecognised'
-                WHEN INV_MARKET IS NULL OR INV_MARKET = '' THEN 'Unknown'
-                WHEN LOCATE('/', INV_MARKET) > 0 THEN SUBSTR(INV_MARKET, 1, LOCATE('/', INV_MARKET) - 1)
-                ELSE INV_MARKET
-            END as region,
-            CASE 
-                WHEN INV_MARKET = '-Unrecognised-' THEN 'Unrecognised'
-                WHEN INV_MARKET IS NULL OR INV_MARKET = '' THEN 'Unknown'
-                WHEN LOCATE('/', INV_MARKET) > 0 THEN SUBSTR(INV_MARKET, LOCATE('/', INV_MARKET) + 1)
-                ELSE 'Unknown'
-            END as market,
-            INV_FUNCTION as function,
-            CAST(INV_TIER as STRING) as tier
-        FROM base_data 
-        WHERE INV_MARKET IS NOT NULL 
-        AND INV_MARKET != ''
+        -- One group per distinct value of each facet; every row has exactly one non-NULL
+        -- facet column, and each facet's values come back in ascending order.
+        -- Explicit LIMIT so databricks_client does not cap the facet rows at 100
+        SELECT region, market, function, tier
+        FROM facet_data
+        GROUP BY GROUPING SETS ((region), (market), (function), (tier))
+        ORDER BY region, market, function, tier
+        LIMIT 10000
         """
         
         # Execute query
-        results = databricks_client.execute_query(filter_query)
+        results = coalesced_query(filter_query)
         
-        # Process results to create filter options
-        regions = set()
-        markets = set()
-        functions = set()
-        tiers = set()
+        # Rows are already distinct and sorted per facet, so a single pass builds the lists
+        filter_options = {'regions': [], 'markets': [], 'functions': [], 'tiers': []}
+        facet_columns = (('region', 'regions'), ('market', 'markets'), ('function', 'functions'), ('tier', 'tiers'))
         
         for row in results:
-            if row.get('region'):
-                regions.add(row['region'])
-            if row.get('market'):
-                markets.add(row['market'])
-            if row.get('function'):
-                functions.add(row['function'])
-            if row.get('tier'):
-                tiers.add(row['tier'])
+            for column, option_key in facet_columns:
+                if row.get(column):
+                    filter_options[option_key].append(row[column])
+                    break
         
         response_data = {
             'status': 'success',
-            'data': {
-                'regions': sorted(list(regions)),
-                'markets': sorted(list(markets)),
-                'functions': sorted(list(functions)),
-                'tiers': sorted(list(tiers))
-            }
+            'data': filter_options
         }
         
         # Cache for 30 minutes
@@ -541,6 +927,90 @@ def get_region_filter_options():
         }), 500
 
 
+# Read-only endpoints that can be bundled into one /api/data/batch request
+BATCHABLE_PATHS = frozenset({
+    '/api/data/portfolio',
+    '/api/data/program',
+    '/api/data/programs_bulk',
+    '/api/data/subprogram',
+    '/api/data/region',
+    '/api/data/region/filters'
+})
+MAX_BATCH_REQUESTS = 50
+
+# Sub-requests get their own pool so they can never starve work queued on EXECUTOR
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+
+def dispatch_subrequest(path: str, args: Dict[str, Any]) -> Tuple[int, bytes]:
+    """Run the GET handler for `path` in-process, without HTTP or WSGI, returning (status, JSON body)."""
+    # Bodies are spliced into the batch reply as JSON, so NDJSON can't be requested here
+    args = {k: v for k, v in args.items() if k != 'format'}
+    with app.test_request_context(path, method='GET', query_string=args):
+        response = app.make_response(app.dispatch_request())
+        return response.status_code, response.get_data()
+
+
+def run_subrequest(sub_request: Any) -> bytes:
+    """Execute one batch entry and encode its reply object."""
+    if not isinstance(sub_request, dict):
+        sub_request = {}
+    path = sub_request.get('path')
+    args = sub_request.get('args') or {}
+    
+    if path not in BATCHABLE_PATHS or not isinstance(args, dict):
+        status_code, body = 400, orjson.dumps({
+            'status': 'error',
+            'message': f'Unsupported batch request: {path!r}',
+            'mode': 'databricks'
+        })
+    else:
+        try:
+            status_code, body = dispatch_subrequest(path, args)
+        except Exception as e:
+            logger.error(f"Batch sub-request {path} failed: {str(e)}")
+            status_code, body = 500, orjson.dumps({
+                'status': 'error',
+                'message': f'Failed to process {path}: {str(e)}',
+                'mode': 'databricks'
+            })
+    
+    # The handler's JSON is spliced in as-is rather than decoded and re-encoded
+    return b'{"path":' + orjson.dumps(path) + b',"status_code":' + str(status_code).encode() + b',"body":' + body + b'}'
+
+
+@app.route('/api/data/batch', methods=['POST'])
+def get_batch_data():
+    """
+    Serve several progressive-loading requests in one round-trip.
+    
+    Body: {"requests": [{"path": "/api/data/program", "args": {"page": 1}}, ...]}.
+    Sub-requests run concurrently and replies keep request order.
+    """
+    payload = request.get_json(silent=True) or {}
+    sub_requests = payload.get('requests') if isinstance(payload, dict) else None
+    
+    if not isinstance(sub_requests, list) or not sub_requests:
+        return jsonify({
+            'status': 'error',
+            'message': 'Body must be a JSON object with a non-empty "requests" list',
+            'mode': 'databricks'
+        }), 400
+    
+    if len(sub_requests) > MAX_BATCH_REQUESTS:
+        return jsonify({
+            'status': 'error',
+            'message': f'At most {MAX_BATCH_REQUESTS} requests are allowed per batch',
+            'mode': 'databricks'
+        }), 400
+    
+    logger.info(f"Processing batch of {len(sub_requests)} requests")
+    replies = list(BATCH_EXECUTOR.map(run_subrequest, sub_requests))
+    
+    body = b'{"status":"success","replies":[' + b','.join(replies) + b'],"mode":"databricks"}'
+    return app.response_class(body, mimetype='application/json')
+
+
 # =============================================================================
 # LEGACY ENDPOINT (Kept for minimal backward compatibility with limited data)
 # =============================================================================
@@ -559,23 +1029,27 @@ def get_paginated_data():
         
         logger.info(f"🚀 Fetching limited paginated data (page={page}, size={page_size}, cache={use_cache})")
         
-        # Execute both queries with pagination - using smaller page sizes
-        hierarchy_result = databricks_client.execute_paginated_query(
-            open(HIERARCHY_QUERY_FILE, 'r').read(),
+        # Execute both queries concurrently with pagination - using smaller page sizes
+        hierarchy_future = EXECUTOR.submit(
+            databricks_client.execute_paginated_query,
+            HIERARCHY_QUERY,
             page=page,
             page_size=page_size,
             use_cache=use_cache,
             cache_ttl=300  # 5 minutes cache for legacy endpoint
         )
         
-        investment_result = databricks_client.execute_paginated_query(
-            open(INVESTMENT_QUERY_FILE, 'r').read(),
+        investment_future = EXECUTOR.submit(
+            databricks_client.execute_paginated_query,
+            INVESTMENT_QUERY,
             page=page,
             page_size=page_size,
             use_cache=use_cache,
             cache_ttl=300
         )
         
+        hierarchy_result, investment_result = hierarchy_future.result(), investment_future.result()
+        
         logger.info(f"✅ Successfully fetched limited paginated data")
         
         return jsonify({
@@ -614,6 +1088,12 @@ def get_paginated_data():
 # REMOVED: /api/investments - Use /api/data/portfolio, /api/data/program, etc.
 # REMOVED: /api/data - Use specific progressive endpoints based on context
 #
+# Pagination: the progressive endpoints accept `after=<cursor>` for keyset
+# (seek) pagination on (CHILD_ID, COE_ROADMAP_PARENT_ID). Pass the opaque
+# `pagination.next_after` from the previous response to fetch the next page.
+# `page` (OFFSET paging) is still accepted when `after` is omitted but gets
+# slower with depth - migrate callers to `after`.
+#
 # Migration Guide: See PROGRESSIVE_LOADING_MIGRATION_GUIDE.md
 # =============================================================================
 
@@ -630,41 +1110,42 @@ def get_legacy_full_data():
     try:
         logger.info("🔄 Fetching full legacy data for backward compatibility")
         
-        # Use cache with longer TTL for full dataset
-        cache_key = "legacy_full_data"
-        cached_data = cache_service.get(cache_key)
-        
-        if cached_data:
-            logger.info("✅ Serving full legacy data from cache")
-            return jsonify(cached_data)
-        
-        # Read and execute both queries without pagination
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read()
-        
-        with open(INVESTMENT_QUERY_FILE, 'r') as f:
-            investment_query = f.read()
-        
-        # Execute queries without pagination
-        hierarchy_result = databricks_client.execute_query_unlimited(hierarchy_query, use_cache=True, cache_ttl=600)
-        investment_result = databricks_client.execute_query_unlimited(investment_query, use_cache=True, cache_ttl=600)
-        
-        # Structure the response in the old format
-        response_data = {
-            'status': 'success',
-            'data': {
-                'hierarchy': hierarchy_result,
-                'investment': investment_result
-            },
-            'mode': 'databricks',
-            'note': 'Legacy full dataset endpoint - consider using paginated endpoints for better performance'
-        }
-        
-        # Cache for 10 minutes
-        cache_service.set(cache_key, response_data, ttl=600)
-        
-        logger.info("✅ Successfully fetched and cached full legacy data")
-        return jsonify(response_data)
+        # Execute both queries concurrently without pagination. Rows are streamed from the
+        # cursor in batches rather than materialized, so the full dataset is not cached.
+        stream_futures = [
+            EXECUTOR.submit(databricks_client.execute_query_stream, HIERARCHY_QUERY),
+            EXECUTOR.submit(databricks_client.execute_query_stream, INVESTMENT_QUERY)
+        ]
+        try:
+            hierarchy_result, investment_result = [future.result() for future in stream_futures]
+        except Exception:
+            # Don't leave the query that did start running on the warehouse
+            close_stream_futures(stream_futures)
+            raise
+        
+        if wants_ndjson():
+            logger.info("✅ Streaming full legacy data as NDJSON")
+            response = ndjson_response(
+                {'status': 'success', 'mode': 'databricks'},
+                {'hierarchy': hierarchy_result, 'investment': investment_result}
+            )
+            response.call_on_close(lambda: close_stream_futures(stream_futures))
+            return response
+        
+        # Stream the response in the old format row by row instead of building
+        # the whole JSON document in memory
+        def generate():
+            yield b'{"status":"success","data":{"hierarchy":['
+            yield from iter_json_array(hierarchy_result)
+            yield b'],"investment":['
+            yield from iter_json_array(investment_result)
+            yield b']},"mode":"databricks","note":"Legacy full dataset endpoint - consider using paginated endpoints for better performance"}'
+        
+        logger.info("✅ Streaming full legacy data")
+        response = Response(stream_with_context(generate()), mimetype='application/json')
+        # Also runs if the client disconnects mid-stream, before the investment rows are read
+        response.call_on_close(lambda: close_stream_futures(stream_futures))
+        return response
         
     except Exception as e:
         error_msg = f"Failed to fetch legacy full data: {str(e)}"
@@ -706,6 +1187,9 @@ def clear_cache():
         pattern = request.json.get('pattern') if request.json else None
         success = cache_service.clear_cache(pattern)
         
+        # Memoized endpoint responses are not pattern-addressable, so always drop them
+        cache.clear()
+        
         if success:
             return jsonify({
                 'status': 'success',
@@ -764,15 +1248,6 @@ if __name__ == '__main__':
         logger.error("Please check your .env file and ensure all required variables are set.")
         exit(1)
     
-    # Check if SQL query files exist
-    if not os.path.exists(HIERARCHY_QUERY_FILE):
-        logger.error(f"Hierarchy query file not found: {HIERARCHY_QUERY_FILE}")
-        exit(1)
-    
-    if not os.path.exists(INVESTMENT_QUERY_FILE):
-        logger.error(f"Investment query file not found: {INVESTMENT_QUERY_FILE}")
-        exit(1)
-    
     # Start the Flask server
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
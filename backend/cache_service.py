@@ -3,11 +3,12 @@ Cache service for PMO Portfolio API with Redis fallback to disk cache.
 Provides intelligent caching for expensive Databricks queries.
 """
 import hashlib
-import json
 import logging
 import os
-from datetime import datetime, timedelta
-from typing import Any, Optional, Dict
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Dict, Tuple
 
 try:
     import redis
@@ -16,9 +17,84 @@ except ImportError:
     REDIS_AVAILABLE = False
 
 import diskcache as dc
+import orjson
+import zstandard as zstd
+from cachetools import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# One blocking pool per process so every Flask thread reuses the same Redis sockets
+# instead of contending on (or opening) per-client connections.
+REDIS_POOL = redis.BlockingConnectionPool(
+    host='localhost',
+    port=6379,
+    db=0,
+    max_connections=int(os.getenv('REDIS_POOL_SIZE', '50')),
+    timeout=float(os.getenv('REDIS_BLOCK_TIMEOUT', '1.0')),
+    socket_timeout=2,
+    socket_connect_timeout=2
+) if REDIS_AVAILABLE else None
+
+# diskcache/SQLite tuning, pinned explicitly. WAL with synchronous=NORMAL avoids an fsync
+# per set; values above disk_min_file_size spill to files instead of bloating SQLite.
+DISK_CACHE_SETTINGS = {
+    'size_limit': 500_000_000,  # 500MB limit
+    'sqlite_journal_mode': 'WAL',
+    'sqlite_synchronous': 'NORMAL',
+    'sqlite_mmap_size': 256 << 20,
+    'sqlite_cache_size': 8192,
+    'disk_min_file_size': 32768
+}
+
+# Chance that a cache hit also evicts its entry, so a poisoned or stale key is
+# recomputed eventually instead of being served until its TTL expires.
+FORGET_PROBABILITY = 0.01
+
+# Redis payloads of at least this many bytes are zstd-compressed; row-oriented JSON with
+# repeated column names typically shrinks 5-10x
+COMPRESS_MIN_BYTES = 1024
+ZSTD_LEVEL = 3
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Budget for the in-process L1, measured in encoded JSON bytes rather than entries so a
+# few full-hierarchy payloads can't pin hundreds of MB per worker
+L1_MAX_BYTES = int(os.getenv('CACHE_L1_MAX_BYTES', str(64 << 20)))
+
+# zstd (de)compressor objects must not be used concurrently, so keep one pair per thread
+_zstd_local = threading.local()
+
+
+def _zstd_compressor() -> zstd.ZstdCompressor:
+    if not hasattr(_zstd_local, 'compressor'):
+        _zstd_local.compressor = zstd.ZstdCompressor(level=ZSTD_LEVEL)
+    return _zstd_local.compressor
+
+
+def _zstd_decompressor() -> zstd.ZstdDecompressor:
+    if not hasattr(_zstd_local, 'decompressor'):
+        _zstd_local.decompressor = zstd.ZstdDecompressor()
+    return _zstd_local.decompressor
+
+
+def _dump_json(data: Any) -> bytes:
+    """Serialize a value to the JSON every cache tier stores."""
+    return orjson.dumps(data, default=str, option=orjson.OPT_NAIVE_UTC)  # default=str covers Decimal and other non-native types
+
+
+def _compress(payload: bytes) -> bytes:
+    """Compress serialized JSON for Redis/disk when it is large."""
+    if len(payload) >= COMPRESS_MIN_BYTES:
+        payload = _zstd_compressor().compress(payload)
+    return payload
+
+
+def _decompress(payload: bytes) -> bytes:
+    """Inverse of `_compress`; plain (uncompressed) payloads are accepted as-is."""
+    if payload.startswith(_ZSTD_MAGIC):
+        # Frames written by compress() carry their content size, so no max_output_size is needed
+        payload = _zstd_decompressor().decompress(payload)
+    return payload
+
 
 class CacheService:
     """
@@ -30,18 +106,24 @@ class CacheService:
         self.default_ttl = default_ttl  # 5 minutes default
         self.cache_dir = cache_dir
         
+        # Disk writes run off the request thread
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cache-io')
+        
+        # Process-local L1 in front of Redis/disk so hot keys skip the socket and decode.
+        # Entries are (decoded value, JSON size) pairs bounded by total size, and live at most
+        # default_ttl; values are shared, so callers must not mutate them.
+        self._l1 = TTLCache(maxsize=L1_MAX_BYTES, ttl=default_ttl, getsizeof=lambda entry: entry[1])
+        self._l1_lock = threading.Lock()
+        
+        # Per-key locks for get_or_compute, refcounted so idle keys don't accumulate
+        self._key_locks: Dict[str, list] = {}
+        self._key_locks_guard = threading.Lock()
+        
         # Try to connect to Redis first
         self.redis_client = None
         if REDIS_AVAILABLE:
             try:
-                self.redis_client = redis.Redis(
-                    host='localhost', 
-                    port=6379, 
-                    db=0, 
-                    decode_responses=True,
-                    socket_timeout=2,
-                    socket_connect_timeout=2
-                )
+                self.redis_client = redis.Redis(connection_pool=REDIS_POOL)
                 # Test connection
                 self.redis_client.ping()
                 logger.info("✅ Redis cache connected successfully")
@@ -52,7 +134,7 @@ class CacheService:
         # Always initialize disk cache as fallback
         os.makedirs(cache_dir, exist_ok=True)
         try:
-            self.disk_cache = dc.Cache(cache_dir, size_limit=500_000_000)  # 500MB limit
+            self.disk_cache = dc.Cache(cache_dir, **DISK_CACHE_SETTINGS)
             logger.info(f"✅ Disk cache initialized at {cache_dir}")
         except Exception as e:
             logger.warning(f"⚠️ Disk cache corruption detected: {e}")
@@ -71,7 +153,7 @@ class CacheService:
             
             # Try to initialize cache again
             try:
-                self.disk_cache = dc.Cache(cache_dir, size_limit=500_000_000)
+                self.disk_cache = dc.Cache(cache_dir, **DISK_CACHE_SETTINGS)
                 logger.info(f"✅ Disk cache reinitialized after cleanup at {cache_dir}")
             except Exception as retry_error:
                 logger.error(f"❌ Failed to reinitialize disk cache: {retry_error}")
@@ -80,30 +162,55 @@ class CacheService:
     
     def _generate_key(self, query: str, params: Dict = None) -> str:
         """Generate a consistent cache key from query and parameters."""
-        key_data = f"{query}_{params or {}}"
-        return f"pmo_query_{hashlib.md5(key_data.encode()).hexdigest()}"
+        # Sorted items keep the key independent of dict insertion order
+        h = hashlib.blake2b(digest_size=16)
+        h.update(query.encode())
+        h.update(b'\x00')
+        h.update(repr(sorted((params or {}).items())).encode())
+        return f"pmo_query_{h.hexdigest()}"
+    
+    def get_key(self, query: str, params: Dict = None) -> str:
+        """Return the cache key for a query, for reuse with `get_by_key`/`set_by_key`."""
+        return self._generate_key(query, params)
     
     def get(self, query: str, params: Dict = None) -> Optional[Any]:
         """Get cached result for a query."""
-        cache_key = self._generate_key(query, params)
+        return self.get_by_key(self._generate_key(query, params))
+    
+    def get_by_key(self, cache_key: str) -> Optional[Any]:
+        """Get cached result for a key from `get_key`, without re-hashing the query."""
+        cached = self._lookup(cache_key)
+        if cached is not None and random.random() < FORGET_PROBABILITY:
+            self._forget(cache_key)
+        return cached
+    
+    def _lookup(self, cache_key: str) -> Optional[Any]:
+        """Read a key from the first tier that has it: memory, then Redis, then disk."""
+        with self._l1_lock:
+            entry = self._l1.get(cache_key)
+        if entry is not None:
+            logger.info(f"⚡ Memory cache HIT for key: {cache_key[:20]}...")
+            return entry[0]
         
         # Try Redis first
+        redis_ok = False
         if self.redis_client:
             try:
                 cached = self.redis_client.get(cache_key)
+                redis_ok = True
                 if cached:
                     logger.info(f"🚀 Redis cache HIT for key: {cache_key[:20]}...")
-                    return json.loads(cached)
+                    return self._l1_set(cache_key, _decompress(cached))
             except Exception as e:
                 logger.warning(f"Redis get error: {e}")
         
-        # Fallback to disk cache
-        if self.disk_cache:
+        # Fallback to disk cache, which only holds entries written while Redis was unavailable
+        if self.disk_cache is not None and not redis_ok:
             try:
                 cached = self.disk_cache.get(cache_key)
                 if cached:
                     logger.info(f"💾 Disk cache HIT for key: {cache_key[:20]}...")
-                    return cached
+                    return self._l1_set(cache_key, _decompress(cached))
             except Exception as e:
                 logger.warning(f"Disk cache get error: {e}")
         
@@ -112,39 +219,120 @@ class CacheService:
     
     def set(self, query: str, data: Any, ttl: int = None, params: Dict = None) -> bool:
         """Store result in cache with TTL."""
-        cache_key = self._generate_key(query, params)
+        return self.set_by_key(self._generate_key(query, params), data, ttl=ttl)
+    
+    def set_by_key(self, cache_key: str, data: Any, ttl: int = None) -> bool:
+        """Store result under a key from `get_key`, without re-hashing the query."""
+        return self._store(cache_key, data, ttl)[1]
+    
+    def store_by_key(self, cache_key: str, data: Any, ttl: int = None) -> Any:
+        """
+        Like `set_by_key`, but return the value as any later cache hit will: JSON-decoded,
+        so e.g. Decimals are strings and naive datetimes are UTC ISO strings. Callers
+        that respond with freshly loaded data should use this so misses and hits match.
+        """
+        return self._store(cache_key, data, ttl)[0]
+    
+    def _store(self, cache_key: str, data: Any, ttl: int = None) -> Tuple[Any, bool]:
+        """Write a value to every applicable tier; returns (decoded value, stored anywhere)."""
         ttl = ttl or self.default_ttl
+        payload = _dump_json(data)
+        data = self._l1_set(cache_key, payload)
         
         success = False
+        payload = _compress(payload)
         
         # Try Redis first
         if self.redis_client:
             try:
-                self.redis_client.setex(
-                    cache_key, 
-                    ttl, 
-                    json.dumps(data, default=str)  # Handle datetime serialization
-                )
+                self.redis_client.setex(cache_key, ttl, payload)
                 logger.info(f"✅ Redis cache SET for key: {cache_key[:20]}... (TTL: {ttl}s)")
                 success = True
             except Exception as e:
                 logger.warning(f"Redis set error: {e}")
         
-        # Always store in disk cache as backup
-        if self.disk_cache:
+        # Fall back to disk cache only when Redis is unavailable, in the background so misses
+        # don't pay for it. Writing both would double serialization and churn the disk budget.
+        if self.disk_cache is not None and not success:
+            self._io_pool.submit(self._disk_set, cache_key, payload, ttl)
+            success = True
+        
+        return data, success
+    
+    def get_or_compute(self, query: str, loader: Callable[[], Any], ttl: int = None,
+                       params: Dict = None) -> Any:
+        """
+        Return the cached result for a query, calling `loader` to build it on a miss.
+        Concurrent misses for the same key wait for a single loader call instead of all
+        hitting Databricks at once.
+        """
+        cache_key = self._generate_key(query, params)
+        cached = self.get_by_key(cache_key)
+        if cached is not None:
+            return cached
+        
+        with self._key_locks_guard:
+            entry = self._key_locks.setdefault(cache_key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                # Another thread may have filled the key while this one waited
+                cached = self._lookup(cache_key)
+                if cached is not None:
+                    return cached
+                data = loader()
+                if data is not None:
+                    data = self.store_by_key(cache_key, data, ttl=ttl)
+                return data
+        finally:
+            with self._key_locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._key_locks[cache_key]
+    
+    def _forget(self, cache_key: str) -> None:
+        """Evict a key from every tier so the next read recomputes it."""
+        logger.info(f"🎲 Forgetting cache entry for key: {cache_key[:20]}...")
+        with self._l1_lock:
+            self._l1.pop(cache_key, None)
+        
+        if self.redis_client:
             try:
-                expire_time = datetime.now() + timedelta(seconds=ttl)
-                self.disk_cache.set(cache_key, data, expire=expire_time)
-                logger.info(f"✅ Disk cache SET for key: {cache_key[:20]}... (TTL: {ttl}s)")
-                success = True
+                self.redis_client.delete(cache_key)
             except Exception as e:
-                logger.warning(f"Disk cache set error: {e}")
+                logger.warning(f"Redis delete error: {e}")
         
-        return success
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.delete(cache_key)
+            except Exception as e:
+                logger.warning(f"Disk cache delete error: {e}")
+    
+    def _l1_set(self, cache_key: str, payload: bytes) -> Any:
+        """Decode a JSON payload, store the result in the in-process cache and return it."""
+        data = orjson.loads(payload)
+        # Payloads bigger than a quarter of the budget would evict most of L1; serve them from Redis/disk
+        if len(payload) <= L1_MAX_BYTES // 4:
+            with self._l1_lock:
+                self._l1[cache_key] = (data, len(payload))
+        return data
+    
+    def _disk_set(self, cache_key: str, payload: bytes, ttl: int) -> None:
+        """Write one encoded entry to the disk cache; runs on the I/O pool."""
+        try:
+            # diskcache takes `expire` as seconds from now
+            self.disk_cache.set(cache_key, payload, expire=ttl)
+            logger.info(f"✅ Disk cache SET for key: {cache_key[:20]}... (TTL: {ttl}s)")
+        except Exception as e:
+            logger.warning(f"Disk cache set error: {e}")
     
     def clear_cache(self, pattern: str = None) -> bool:
         """Clear cache entries matching pattern."""
         try:
+            # Keys are hashed, so the in-process cache can only be cleared as a whole
+            with self._l1_lock:
+                self._l1.clear()
+            
             if self.redis_client and pattern:
                 keys = self.redis_client.keys(f"*{pattern}*")
                 if keys:
@@ -152,7 +340,7 @@ class CacheService:
                     logger.info(f"🗑️ Cleared {len(keys)} Redis cache entries")
             
             # Clear disk cache (pattern not supported, clear all)
-            if not pattern and self.disk_cache:
+            if not pattern and self.disk_cache is not None:
                 self.disk_cache.clear()
                 logger.info("🗑️ Cleared disk cache")
             
@@ -166,7 +354,7 @@ class CacheService:
         stats = {
             "redis_available": self.redis_client is not None,
             "disk_cache_available": self.disk_cache is not None,
-            "disk_cache_size": len(self.disk_cache) if self.disk_cache else 0,
+            "disk_cache_size": len(self.disk_cache) if self.disk_cache is not None else 0,
         }
         
         if self.redis_client:
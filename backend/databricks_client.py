@@ -4,7 +4,12 @@ Enhanced with caching and pagination support.
 """
 import os
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import pyarrow as pa
 from databricks import sql
 from dotenv import load_dotenv
 
@@ -19,6 +24,57 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Scans for the automatic LIMIT logic in execute_query, compiled once so long queries
+# are not upper-cased (copied) on every call
+_LIMIT_RE = re.compile(r'\blimit\b', re.IGNORECASE)
+_INV_IN_RE = re.compile(r'WHERE\s+INV_EXT_ID\s+IN', re.IGNORECASE)
+
+# Seconds a connection may sit idle before it is pinged again prior to reuse
+CONNECTION_CHECK_INTERVAL = 60
+
+# Idle connections kept for threads without their own (e.g. per-request server threads)
+CONNECTION_POOL_SIZE = int(os.getenv('DATABRICKS_POOL_SIZE', '4'))
+
+
+class QueryStream:
+    """
+    Iterator over the rows of an executed streaming query, fetched `batch_size` at a time.
+    
+    It owns its cursor and connection. They are released when iteration finishes, or by
+    `close()`. Call `close()` if the stream might never be fully consumed (e.g. the
+    request fails or the client disconnects), since an unstarted iterator cannot clean
+    up after itself. `close()` is idempotent.
+    """
+    
+    def __init__(self, connection, cursor, batch_size: int):
+        self._connection = connection
+        self._cursor = cursor
+        self._batch_size = batch_size
+        self._closed = False
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        row_count = 0
+        try:
+            while not self._closed:
+                batch = self._cursor.fetchmany_arrow(self._batch_size)
+                if batch.num_rows == 0:
+                    logger.info(f"✅ Streaming query completed, returned {row_count} rows")
+                    break
+                row_count += batch.num_rows
+                yield from batch.to_pylist()
+        finally:
+            self.close()
+    
+    def close(self) -> None:
+        """Close the cursor (cancelling the query if it is still running) and the connection."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._cursor.close()
+        finally:
+            self._connection.close()
+
 
 class DatabricksClient:
     """
@@ -39,22 +95,121 @@ class DatabricksClient:
                 "and DATABRICKS_ACCESS_TOKEN environment variables."
             )
         
+        # Databricks connections must not be shared between threads (DB-API threadsafety 1).
+        # Long-lived threads (worker pools registered via `thread_initializer`, or threads
+        # that call `connect()`) keep their own connection in thread-local storage. Every
+        # other thread - the dev server starts one per request - checks a connection out of
+        # a small shared pool for the duration of a query, so sessions outlive requests.
+        self._local = threading.local()
+        self._idle_connections: List[Tuple[Any, float]] = []  # (connection, last used)
+        self._idle_lock = threading.Lock()
         self.connection = None
     
-    def connect(self) -> None:
-        """Establish connection to Databricks."""
+    @property
+    def connection(self):
+        """The Databricks connection owned by the current thread."""
+        return getattr(self._local, 'connection', None)
+    
+    @connection.setter
+    def connection(self, value) -> None:
+        self._local.connection = value
+    
+    def _open_connection(self):
+        """Open a new Databricks connection."""
         try:
-            self.connection = sql.connect(
+            connection = sql.connect(
                 server_hostname=self.server_hostname,
                 http_path=self.http_path,
                 access_token=self.access_token,
                 _user_agent_entry="PMO-Portfolio/1.0.0"
             )
             logger.info("Successfully connected to Databricks")
+            return connection
         except Exception as e:
             logger.error(f"Failed to connect to Databricks: {str(e)}")
             raise
     
+    def connect(self) -> None:
+        """Establish connection to Databricks for the current thread."""
+        self.connection = self._open_connection()
+        # A fresh connection needs no health check before its first query
+        self._local.last_used = time.monotonic()
+    
+    def thread_initializer(self) -> None:
+        """
+        `ThreadPoolExecutor` initializer giving each long-lived worker thread its own
+        connection, opened lazily on the thread's first query.
+        """
+        self._local.owns_connection = True
+    
+    def _is_usable(self, connection, last_used: float) -> bool:
+        """
+        Whether a connection can be reused: it must be open, and pass a `SELECT 1` ping
+        if it has sat idle longer than CONNECTION_CHECK_INTERVAL. Unusable ones are closed.
+        """
+        if not connection.open:
+            return False
+        if time.monotonic() - last_used <= CONNECTION_CHECK_INTERVAL:
+            return True
+        
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            return True
+        except Exception as e:
+            logger.warning(f"Databricks connection failed health check, reconnecting: {str(e)}")
+            try:
+                connection.close()
+            except Exception:
+                pass
+            return False
+    
+    def _ensure_connection(self):
+        """Return this thread's own connection, reconnecting if it is missing or unusable."""
+        connection = self.connection
+        if connection is None or not self._is_usable(connection, getattr(self._local, 'last_used', 0)):
+            self.connect()
+            connection = self.connection
+        
+        self._local.last_used = time.monotonic()
+        return connection
+    
+    def _checkout_connection(self):
+        """Take a usable idle connection from the shared pool, or open a new one."""
+        while True:
+            with self._idle_lock:
+                if not self._idle_connections:
+                    break
+                connection, last_used = self._idle_connections.pop()
+            if self._is_usable(connection, last_used):
+                return connection
+        return self._open_connection()
+    
+    def _return_connection(self, connection) -> None:
+        """Put a checked-out connection back in the pool, closing it if the pool is full."""
+        if connection.open:
+            with self._idle_lock:
+                if len(self._idle_connections) < CONNECTION_POOL_SIZE:
+                    self._idle_connections.append((connection, time.monotonic()))
+                    return
+            connection.close()
+    
+    @contextmanager
+    def _connection_for_query(self):
+        """
+        Yield the connection to run one query on: the thread's own connection for
+        long-lived threads, otherwise one checked out of the shared pool until the query ends.
+        """
+        if getattr(self._local, 'owns_connection', False) or self.connection is not None:
+            yield self._ensure_connection()
+        else:
+            connection = self._checkout_connection()
+            try:
+                yield connection
+            finally:
+                self._return_connection(connection)
+    
     def disconnect(self) -> None:
         """Close the Databricks connection."""
         if self.connection:
@@ -77,67 +232,66 @@ class DatabricksClient:
         Returns:
             List[Dict[str, Any]]: Query results as list of dictionaries
         """
-        # Create cache key including parameters for security
-        cache_key = f"{query}_{str(parameters) if parameters else ''}"
+        # Create cache key including parameters for security. The query is hashed as-is and the
+        # parameters are sorted by the cache service; only surrounding whitespace is normalized.
+        query = query.strip()
+        cache_key = cache_service.get_key(query, parameters)
         
         # Check cache first if enabled
         if use_cache:
-            cached_result = cache_service.get(cache_key)
+            cached_result = cache_service.get_by_key(cache_key)
             if cached_result is not None:
                 logger.info(f"🚀 Cache hit! Returning {len(cached_result)} cached rows")
                 return cached_result
         
-        if not self.connection:
-            self.connect()
-        
-        try:
-            cursor = self.connection.cursor()
-            
-            # Add reasonable LIMIT to very long queries if not already present
-            # But allow larger limits for filtered queries (e.g., WHERE INV_EXT_ID IN (...))
-            if len(query) > 2000 and "LIMIT" not in query.upper():
-                if "WHERE INV_EXT_ID IN" in query:
-                    # For filtered investment queries, use a much higher limit since we're targeting specific records
-                    # The CaTAlyst data exists but is beyond the 1000 row limit - trying 15000 to be absolutely sure
-                    logger.info("Adding LIMIT 15000 to filtered investment query to ensure all targeted records are included")
-                    query = query.rstrip(';') + "\nLIMIT 15000;"
+        with self._connection_for_query() as connection:
+            try:
+                cursor = connection.cursor()
+                
+                # Add reasonable LIMIT to very long queries if not already present
+                # But allow larger limits for filtered queries (e.g., WHERE INV_EXT_ID IN (...))
+                if len(query) > 2000 and not _LIMIT_RE.search(query):
+                    if _INV_IN_RE.search(query):
+                        # For filtered investment queries, use a much higher limit since we're targeting specific records
+                        # The CaTAlyst data exists but is beyond the 1000 row limit - trying 15000 to be absolutely sure
+                        logger.info("Adding LIMIT 15000 to filtered investment query to ensure all targeted records are included")
+                        query = query.rstrip(';') + "\nLIMIT 15000;"
+                    else:
+                        logger.warning("Adding LIMIT 100 to large query to prevent timeout")
+                        query = query.rstrip(';') + "\nLIMIT 100;"
+                
+                logger.info(f"🔍 Executing query (length: {len(query)} chars)")
+                
+                # Execute with or without parameters
+                if parameters:
+                    cursor.execute(query, parameters)
                 else:
-                    logger.warning("Adding LIMIT 100 to large query to prevent timeout")
-                    query = query.rstrip(';') + "\nLIMIT 100;"
-            
-            logger.info(f"🔍 Executing query (length: {len(query)} chars)")
-            
-            # Execute with or without parameters
-            if parameters:
-                cursor.execute(query, parameters)
-            else:
-                cursor.execute(query)
-            
-            # Get column names
-            columns = [desc[0] for desc in cursor.description]
-            
-            # Fetch all results and convert to list of dictionaries
-            results = []
-            for row in cursor.fetchall():
-                results.append(dict(zip(columns, row)))
-            
-            cursor.close()
-            logger.info(f"✅ Query executed successfully, returned {len(results)} rows")
-            
-            # Cache the results if caching is enabled
-            if use_cache and results:
-                cache_service.set(cache_key, results, ttl=cache_ttl)
-            
-            return results
-            
-        except Exception as e:
-            logger.error(f"❌ Query execution failed: {str(e)}")
-            raise
+                    cursor.execute(query)
+                
+                # Fetch all results as one Arrow table and convert to list of dictionaries in C,
+                # rather than building a dict per row in Python
+                results = cursor.fetchall_arrow().to_pylist()
+                
+                cursor.close()
+                logger.info(f"✅ Query executed successfully, returned {len(results)} rows")
+                
+                # Cache the results if caching is enabled
+                if use_cache and results:
+                    results = cache_service.store_by_key(cache_key, results, ttl=cache_ttl)
+                
+                return results
+                
+            except Exception as e:
+                logger.error(f"❌ Query execution failed: {str(e)}")
+                raise
     
-    def execute_query_unlimited(self, query: str, timeout: int = 1200, use_cache: bool = True, cache_ttl: int = 1800) -> List[Dict[str, Any]]:
+    def execute_query_unlimited(self, query: str, timeout: int = 1200, use_cache: bool = True, cache_ttl: int = 1800) -> pa.Table:
         """
         Execute a SQL query without automatic LIMIT addition for large datasets.
         
+        Results stay columnar as a pyarrow Table so bulk consumers can filter them with
+        pyarrow.compute and only convert to Python records at the output boundary.
+        
         Args:
             query (str): The SQL query to execute
             timeout (int): Query timeout in seconds (default: 1200 = 20 minutes)
@@ -145,45 +299,73 @@ class DatabricksClient:
             cache_ttl (int): Cache time-to-live in seconds (default 30 minutes)
             
         Returns:
-            List[Dict[str, Any]]: Query results as list of dictionaries
+            pa.Table: Query results as an Arrow table
         """
-        # Check cache first if enabled
+        cache_key = cache_service.get_key(query)
+        
+        # Check cache first if enabled (entries are stored as records, which the cache can serialize)
         if use_cache:
-            cached_result = cache_service.get(query)
+            cached_result = cache_service.get_by_key(cache_key)
             if cached_result is not None:
                 logger.info(f"🚀 Cache hit! Returning {len(cached_result)} cached rows")
-                return cached_result
+                return pa.Table.from_pylist(cached_result)
         
-        if not self.connection:
-            self.connect()
+        with self._connection_for_query() as connection:
+            try:
+                cursor = connection.cursor()
+                
+                # Don't add automatic LIMIT for unlimited queries
+                logger.info(f"🔍 Executing unlimited query (length: {len(query)} chars)")
+                cursor.execute(query)
+                
+                # Fetch all results as one Arrow table
+                results = cursor.fetchall_arrow()
+                
+                cursor.close()
+                logger.info(f"✅ Unlimited query executed successfully, returned {results.num_rows} rows")
+                
+                # Cache the results if caching is enabled
+                if use_cache and results.num_rows:
+                    cache_service.set_by_key(cache_key, results.to_pylist(), ttl=cache_ttl)
+                
+                return results
+                
+            except Exception as e:
+                logger.error(f"❌ Unlimited query execution failed: {str(e)}")
+                raise
+    
+    def execute_query_stream(self, query: str, batch_size: int = 5000) -> QueryStream:
+        """
+        Execute a SQL query and stream its rows from the cursor in batches.
+        
+        The query is executed immediately so errors surface to the caller, but rows are
+        only fetched `batch_size` at a time as the returned iterator is consumed, so the
+        full result set is never materialized. Results are not cached.
+        
+        The stream runs on its own connection, closed once the iterator is exhausted or the
+        stream is closed, so it can be executed on one thread and consumed on another.
+        
+        Args:
+            query (str): The SQL query to execute
+            batch_size (int): Number of rows fetched per round-trip
+            
+        Returns:
+            QueryStream: Iterator over query rows as dictionaries
+        """
+        connection = self._open_connection()
         
         try:
-            cursor = self.connection.cursor()
+            cursor = connection.cursor(arraysize=batch_size)
             
-            # Don't add automatic LIMIT for unlimited queries
-            logger.info(f"🔍 Executing unlimited query (length: {len(query)} chars)")
+            logger.info(f"🔍 Executing streaming query (length: {len(query)} chars)")
             cursor.execute(query)
             
-            # Get column names
-            columns = [desc[0] for desc in cursor.description]
-            
-            # Fetch all results and convert to list of dictionaries
-            results = []
-            for row in cursor.fetchall():
-                results.append(dict(zip(columns, row)))
-            
-            cursor.close()
-            logger.info(f"✅ Unlimited query executed successfully, returned {len(results)} rows")
-            
-            # Cache the results if caching is enabled
-            if use_cache and results:
-                cache_service.set(query, results, ttl=cache_ttl)
-            
-            return results
-            
         except Exception as e:
-            logger.error(f"❌ Unlimited query execution failed: {str(e)}")
+            logger.error(f"❌ Streaming query execution failed: {str(e)}")
+            connection.close()
             raise
+        
+        return QueryStream(connection, cursor, batch_size)
     
     def execute_paginated_query(
         self, 
@@ -206,47 +388,48 @@ class DatabricksClient:
         Returns:
             Dictionary with paginated data and metadata
         """
-        # Create cache key including pagination params
-        cache_params = {"page": page, "page_size": page_size}
-        
-        # Check cache first
-        if use_cache:
-            cached_result = cache_service.get(query, cache_params)
-            if cached_result is not None:
-                logger.info(f"📄 Returning cached paginated result for page {page}")
-                return cached_result
-        
         try:
-            # For very large queries, we'll paginate at the database level
-            if len(query) > 1000:
-                # Add pagination to the query
-                paginated_query = pagination_service.add_pagination_to_query(query, page, page_size)
-                
-                # Execute the paginated query
-                results = self.execute_query(paginated_query, use_cache=False)  # Don't double-cache
-                
-                # For large queries, we'll estimate total count to avoid expensive COUNT queries
-                total_count = len(results) * 10  # Rough estimate for development
-                if len(results) < page_size:
-                    # If we got fewer results than requested, we're near the end
-                    total_count = (page - 1) * page_size + len(results)
-                
-                # Create pagination metadata
-                metadata = pagination_service.create_pagination_metadata(total_count, page, page_size)
-                
-                result = {
-                    "data": results,
-                    **metadata
-                }
-                
-            else:
-                # For smaller queries, get full results and paginate in memory
+            # For smaller queries, get full results and paginate in memory. The full list is
+            # cached once by execute_query; slices are cheap to recompute on every request.
+            if len(query) <= 1000:
                 full_results = self.execute_query(query, use_cache=use_cache, cache_ttl=cache_ttl)
-                result = pagination_service.paginate_list(full_results, page, page_size)
+                return pagination_service.paginate_list(full_results, page, page_size)
+            
+            # For very large queries, we'll paginate at the database level and cache only the page
+            cache_params = {"page": page, "page_size": page_size}
+            cache_key = cache_service.get_key(query, cache_params)
+            
+            # Check cache first
+            if use_cache:
+                cached_result = cache_service.get_by_key(cache_key)
+                if cached_result is not None:
+                    logger.info(f"📄 Returning cached paginated result for page {page}")
+                    return cached_result
+            
+            # Add pagination to the query, with the total row count as a window column
+            paginated_query, page_params = pagination_service.add_pagination_to_query(
+                query, page, page_size, with_total_count=True
+            )
+            
+            # Execute the paginated query
+            results = self.execute_query(paginated_query, parameters=page_params, use_cache=False)  # Don't double-cache
+            
+            # The count arrives with the page; an empty page (past the end) carries none
+            total_count = pagination_service.pop_total_count(results)
+            if total_count is None:
+                total_count = (page - 1) * page_size
+            
+            # Create pagination metadata
+            metadata = pagination_service.create_pagination_metadata(total_count, page, page_size)
+            
+            result = {
+                "data": results,
+                **metadata
+            }
             
             # Cache the paginated result
             if use_cache:
-                cache_service.set(query, result, ttl=cache_ttl, params=cache_params)
+                result = cache_service.store_by_key(cache_key, result, ttl=cache_ttl)
             
             return result
             
@@ -4,102 +4,122 @@ Generate portfolio data JSON file from live Databricks database
 Only includes records where COE_ROADMAP_TYPE = 'Portfolio'
 """
 
-import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import orjson
+import pyarrow.compute as pc
 from databricks_client import DatabricksClient
 
+def run_unlimited_query(client, query):
+    """Run a query without automatic LIMIT on a connection owned by the calling thread"""
+    client.connect()
+    try:
+        return client.execute_query_unlimited(query, timeout=900, use_cache=False)
+    finally:
+        client.disconnect()
+
+def write_json_rows(f, table, batch_size=5000):
+    """Write the rows of an Arrow table as JSON array elements, one per line, a batch at a time"""
+    separator = b'\n'
+    for batch in table.to_batches(max_chunksize=batch_size):
+        for record in batch.to_pylist():
+            f.write(separator)
+            f.write(orjson.dumps(record, default=str))
+            separator = b',\n'
+
 def generate_portfolio_json():
     """Generate JSON file with live portfolio data from Databricks"""
     
     print("🚀 Starting live portfolio data generation...")
     
-    # Initialize Databricks client
+    # Initialize Databricks client (connections are per thread, so each query gets its own)
     client = DatabricksClient()
     
     try:
-        # Connect to database
-        print("📡 Connecting to Databricks...")
-        client.connect()
-        
         # Read hierarchy query
         hierarchy_query_path = os.path.join(os.path.dirname(__file__), 'sql_queries', 'hierarchy_query.sql')
         with open(hierarchy_query_path, 'r') as f:
-            hierarchy_query = f.read()
+            hierarchy_query = f.read().strip().rstrip(';')
         
         # Read investment query  
         investment_query_path = os.path.join(os.path.dirname(__file__), 'sql_queries', 'investment_query.sql')
         with open(investment_query_path, 'r') as f:
-            investment_query = f.read()
-        
-        print("📊 Executing hierarchy query...")
-        # Execute hierarchy query without automatic LIMIT
-        hierarchy_data = client.execute_query_unlimited(hierarchy_query, timeout=900, use_cache=False)
-        print(f"✅ Hierarchy query completed: {len(hierarchy_data)} records")
-        
-        print("📊 Executing investment query...")
-        # Execute investment query without automatic LIMIT  
-        investment_data = client.execute_query_unlimited(investment_query, timeout=900, use_cache=False)
-        print(f"✅ Investment query completed: {len(investment_data)} records")
-        
-        # Filter for Portfolio records only
-        portfolio_hierarchy = [
-            record for record in hierarchy_data 
-            if record.get('COE_ROADMAP_TYPE') == 'Portfolio'
-        ]
-        
-        print(f"🎯 Found {len(portfolio_hierarchy)} Portfolio records in hierarchy")
-        
-        # Extract Portfolio IDs to filter investment data
-        portfolio_ids = {record['CHILD_ID'] for record in portfolio_hierarchy}
-        
-        # Filter investment data for Portfolio IDs only
-        portfolio_investments = [
-            record for record in investment_data 
-            if record.get('INV_EXT_ID') in portfolio_ids
-        ]
-        
-        print(f"💰 Found {len(portfolio_investments)} investment records for Portfolio IDs")
-        
-        # Create the structured data format matching the API response
-        portfolio_data = {
+            investment_query = f.read().strip().rstrip(';')
+        
+        # Filter in Databricks so only Portfolio rows (and their investments) cross the wire.
+        # The investment side semi-joins on the Portfolio IDs itself, so both queries still
+        # run independently.
+        portfolio_hierarchy_query = f"""
+            SELECT * FROM ({hierarchy_query}) hierarchy_base
+            WHERE COE_ROADMAP_TYPE = 'Portfolio'
+        """
+        portfolio_investment_query = f"""
+            SELECT * FROM ({investment_query}) investment_base
+            WHERE INV_EXT_ID IN (
+                SELECT CHILD_ID FROM ({hierarchy_query}) hierarchy_base
+                WHERE COE_ROADMAP_TYPE = 'Portfolio'
+            )
+        """
+        
+        print("📡 Connecting to Databricks and executing hierarchy and investment queries...")
+        # Both queries are long and independent, so run them concurrently on two connections
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            hierarchy_future = executor.submit(run_unlimited_query, client, portfolio_hierarchy_query)
+            investment_future = executor.submit(run_unlimited_query, client, portfolio_investment_query)
+            # Keep results as columnar Arrow tables rather than one dict per row; they are only
+            # converted to records when serialized below
+            portfolio_hierarchy = hierarchy_future.result()
+            portfolio_investments = investment_future.result()
+        
+        print(f"🎯 Found {portfolio_hierarchy.num_rows} Portfolio records in hierarchy")
+        
+        # Extract Portfolio IDs for the summary (Arrow hash kernel; no per-row Python set insert)
+        portfolio_ids = pc.unique(portfolio_hierarchy['CHILD_ID'])
+        
+        print(f"💰 Found {portfolio_investments.num_rows} investment records for Portfolio IDs")
+        
+        # Create the structured data format matching the API response. The row arrays are
+        # streamed into the file below, so their records never exist all at once.
+        envelope = {
             "status": "success",
             "message": f"Portfolio data generated from live database on {datetime.now().isoformat()}",
-            "timestamp": datetime.now().isoformat(),
-            "data": {
-                "hierarchy": portfolio_hierarchy,
-                "investment": portfolio_investments
-            },
-            "metadata": {
-                "total_portfolio_records": len(portfolio_hierarchy),
-                "total_investment_records": len(portfolio_investments),
-                "unique_portfolio_ids": len(portfolio_ids),
-                "generation_method": "live_databricks_query",
-                "query_files": ["hierarchy_query.sql", "investment_query.sql"],
-                "filter_criteria": "COE_ROADMAP_TYPE = 'Portfolio'"
-            }
+            "timestamp": datetime.now().isoformat()
+        }
+        metadata = {
+            "total_portfolio_records": portfolio_hierarchy.num_rows,
+            "total_investment_records": portfolio_investments.num_rows,
+            "unique_portfolio_ids": len(portfolio_ids),
+            "generation_method": "live_databricks_query",
+            "query_files": ["hierarchy_query.sql", "investment_query.sql"],
+            "filter_criteria": "COE_ROADMAP_TYPE = 'Portfolio'"
         }
         
         # Write to JSON file
         output_file = 'portfolio_live_data.json'
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(portfolio_data, f, indent=2, default=str, ensure_ascii=False)
+        with open(output_file, 'wb', buffering=1 << 20) as f:
+            # Reopen the envelope object (drop its closing brace) to append the data arrays
+            f.write(orjson.dumps(envelope)[:-1] + b',"data":{"hierarchy":[')
+            write_json_rows(f, portfolio_hierarchy)
+            f.write(b'\n],"investment":[')
+            write_json_rows(f, portfolio_investments)
+            f.write(b'\n]},"metadata":' + orjson.dumps(metadata, option=orjson.OPT_INDENT_2) + b'}\n')
         
         print(f"✅ Portfolio data saved to {output_file}")
         print(f"📈 Summary:")
-        print(f"   - Portfolio hierarchy records: {len(portfolio_hierarchy)}")
-        print(f"   - Portfolio investment records: {len(portfolio_investments)}")
+        print(f"   - Portfolio hierarchy records: {portfolio_hierarchy.num_rows}")
+        print(f"   - Portfolio investment records: {portfolio_investments.num_rows}")
         print(f"   - Unique Portfolio IDs: {len(portfolio_ids)}")
         
         # Print sample of Portfolio IDs found
-        sample_portfolios = list(portfolio_ids)[:10]
+        sample_portfolios = portfolio_ids.slice(0, 10).to_pylist()
         print(f"🔍 Sample Portfolio IDs: {sample_portfolios}")
         
         # Print sample portfolio names
         sample_names = [
             f"{record['CHILD_ID']}: {record['CHILD_NAME']}" 
-            for record in portfolio_hierarchy[:5]
+            for record in portfolio_hierarchy.slice(0, 5).select(['CHILD_ID', 'CHILD_NAME']).to_pylist()
         ]
         print(f"📝 Sample Portfolio Names:")
         for name in sample_names:
@@ -110,8 +130,6 @@ def generate_portfolio_json():
     except Exception as e:
         print(f"❌ Error generating portfolio data: {str(e)}")
         raise
-    finally:
-        client.disconnect()
 
 if __name__ == "__main__":
     try:
@@ -1,6 +1,137 @@
 # API Performance Optimization Routes
 # Additional routes to add to app.py for progressive data loading
 
+import hashlib
+from functools import lru_cache
+
+# Each handler's hierarchy and investment queries are independent, so they run side by side.
+# Each long-lived worker keeps its own databricks_client connection, so they never share one.
+ROUTE_EXECUTOR = ThreadPoolExecutor(max_workers=8, initializer=databricks_client.thread_initializer)
+
+HIERARCHY_PAGE_CLAUSE = " ORDER BY COE_ROADMAP_ELEMENT_ID OFFSET %(offset)s ROWS FETCH NEXT %(limit)s ROWS ONLY"
+INVESTMENT_PAGE_CLAUSE = " ORDER BY INVESTMENT_ID OFFSET %(offset)s ROWS FETCH NEXT %(limit)s ROWS ONLY"
+
+
+def _compose_query(base: str, conditions: List[str], page_clause: str) -> str:
+    """Append AND conditions and a paging clause to a base query."""
+    return base + ''.join(f" AND {condition}" for condition in conditions) + page_clause
+
+
+def _compose_templates(hierarchy_conditions: List[str], investment_conditions: List[str]) -> Tuple[str, str]:
+    """Build the final (hierarchy, investment) SQL for one filter combination."""
+    return (
+        _compose_query(HIERARCHY_QUERY, hierarchy_conditions, HIERARCHY_PAGE_CLAUSE),
+        _compose_query(INVESTMENT_QUERY, investment_conditions, INVESTMENT_PAGE_CLAUSE)
+    )
+
+
+# Each endpoint only has a handful of filter combinations, so every variant's SQL is built
+# once here. Handlers just pick a template and bind values, and identical combinations
+# always send Databricks byte-identical statement text.
+PORTFOLIO_TEMPLATES = {
+    (has_portfolio_id, has_status): _compose_templates(
+        (["COE_ROADMAP_PARENT_ID = %(portfolio_id)s"] if has_portfolio_id else [])
+        + (["STATUS = %(status)s"] if has_status else []),
+        (["INVESTMENT_ID LIKE %(portfolio_prefix)s"] if has_portfolio_id else [])
+        + (["STATUS = %(status)s"] if has_status else [])
+    )
+    for has_portfolio_id in (False, True)
+    for has_status in (False, True)
+}
+
+PROGRAM_TEMPLATE = _compose_templates(
+    ["COE_ROADMAP_PARENT_ID = %(portfolio_id)s AND COE_ROADMAP_TYPE = 'Program'"],
+    ["INVESTMENT_ID LIKE %(portfolio_prefix)s"]
+)
+
+# Keyed by whether all sub-programs are requested (programId=ALL)
+SUBPROGRAM_TEMPLATES = {
+    True: _compose_templates(["COE_ROADMAP_TYPE = 'SubProgram'"], []),
+    False: _compose_templates(
+        ["COE_ROADMAP_PARENT_ID = %(program_id)s AND COE_ROADMAP_TYPE = 'SubProgram'"],
+        ["INVESTMENT_ID LIKE %(program_prefix)s"]
+    )
+}
+
+# Keyed by whether a region filter is given
+REGION_TEMPLATES = {
+    has_region: _compose_templates(
+        ["REGION = %(region)s"] if has_region else [],
+        ["REGION = %(region)s"] if has_region else []
+    )
+    for has_region in (False, True)
+}
+
+
+@lru_cache(maxsize=256)
+def _build_queries(kind: str, filter_items: Tuple[Tuple[str, str], ...]) -> Tuple[str, Dict[str, Any], str, Dict[str, Any]]:
+    """
+    Resolve an endpoint kind and its filters to
+    (hierarchy_sql, hierarchy_params, investment_sql, investment_params), without paging.
+    
+    Memoized per (kind, filters); the returned param dicts are shared, so copy before adding to them.
+    """
+    filters = dict(filter_items)
+    hierarchy_params = {}
+    investment_params = {}
+    
+    if kind == 'portfolio':
+        portfolio_id, status = filters.get('portfolio_id'), filters.get('status')
+        hierarchy_query, investment_query = PORTFOLIO_TEMPLATES[(bool(portfolio_id), bool(status))]
+        if portfolio_id:
+            hierarchy_params['portfolio_id'] = portfolio_id
+            investment_params['portfolio_prefix'] = f"{portfolio_id}%"
+        if status:
+            hierarchy_params['status'] = status
+            investment_params['status'] = status
+    elif kind == 'program':
+        portfolio_id = filters['portfolio_id']
+        hierarchy_query, investment_query = PROGRAM_TEMPLATE
+        hierarchy_params['portfolio_id'] = portfolio_id
+        investment_params['portfolio_prefix'] = f"{portfolio_id}%"
+    elif kind == 'subprogram':
+        # programId=ALL loads every sub-program and leaves investments unfiltered
+        program_id = filters['program_id']
+        load_all = program_id.upper() == 'ALL'
+        hierarchy_query, investment_query = SUBPROGRAM_TEMPLATES[load_all]
+        if not load_all:
+            hierarchy_params['program_id'] = program_id
+            investment_params['program_prefix'] = f"{program_id}%"
+    elif kind == 'region':
+        region = filters.get('region')
+        hierarchy_query, investment_query = REGION_TEMPLATES[bool(region)]
+        if region:
+            hierarchy_params['region'] = region
+            investment_params['region'] = region
+    else:
+        raise ValueError(f"Unknown query kind: {kind}")
+    
+    return hierarchy_query, hierarchy_params, investment_query, investment_params
+
+
+def _run_page_queries(kind: str, filters: Dict[str, str], page: int, limit: int) -> Tuple[List[Dict], List[Dict], bool]:
+    """
+    Fetch one page of hierarchy and investment rows for an endpoint kind, concurrently.
+    Returns (hierarchy, investment, has_more).
+    """
+    hierarchy_query, hierarchy_params, investment_query, investment_params = _build_queries(
+        kind, tuple(sorted(filters.items()))
+    )
+    # Paging values are the only per-request part; values are bound as parameters so
+    # Databricks can reuse one plan across them
+    page_params = {'offset': (page - 1) * limit, 'limit': limit}
+    
+    # One extra hierarchy row is fetched to tell whether another page exists
+    hierarchy_future = ROUTE_EXECUTOR.submit(
+        databricks_client.execute_query, hierarchy_query, {**hierarchy_params, **page_params, 'limit': limit + 1}
+    )
+    investment_future = ROUTE_EXECUTOR.submit(
+        databricks_client.execute_query, investment_query, {**investment_params, **page_params}
+    )
+    hierarchy_results, investment_results = hierarchy_future.result(), investment_future.result()
+    return hierarchy_results[:limit], investment_results, len(hierarchy_results) > limit
+
+
 @app.route('/api/data/portfolio', methods=['GET'])
 def get_portfolio_data():
     """Get paginated portfolio-level data."""
@@ -16,64 +147,39 @@ def get_portfolio_data():
         # Remove None values from filters
         filters = {k: v for k, v in filters.items() if v is not None}
         
-        # Create cache key
-        cache_key = f"portfolio_data_p{page}_l{limit}_{hash(str(filters))}"
-        
-        # Check cache first
-        cached_data = cache_service.get(cache_key)
-        if cached_data:
-            logger.info(f"Serving portfolio data from cache: {cache_key}")
-            return jsonify(cached_data)
-        
-        logger.info(f"Fetching portfolio data - Page: {page}, Limit: {limit}, Filters: {filters}")
-        
-        # Read SQL queries
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read()
-        
-        with open(INVESTMENT_QUERY_FILE, 'r') as f:
-            investment_query = f.read()
-        
-        # Modify queries for portfolio-level filtering and pagination
-        if filters.get('portfolio_id'):
-            hierarchy_query += f" AND COE_ROADMAP_PARENT_ID = '{filters['portfolio_id']}'"
-            investment_query += f" AND INVESTMENT_ID LIKE '{filters['portfolio_id']}%'"
-        
-        if filters.get('status'):
-            hierarchy_query += f" AND STATUS = '{filters['status']}'"
-            investment_query += f" AND STATUS = '{filters['status']}'"
-        
-        # Add pagination
-        offset = (page - 1) * limit
-        hierarchy_query += f" ORDER BY COE_ROADMAP_ELEMENT_ID OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-        investment_query += f" ORDER BY INVESTMENT_ID OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-        
-        # Execute queries
-        hierarchy_results = databricks_client.execute_query(hierarchy_query)
-        investment_results = databricks_client.execute_query(investment_query)
-        
-        # Structure response
-        response_data = {
-            'status': 'success',
-            'data': {
-                'hierarchy': hierarchy_results,
-                'investment': investment_results,
-                'pagination': {
-                    'page': page,
-                    'limit': limit,
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+        # Create cache key. Built-in hash() of a str is salted per process, so workers would
+        # never share entries; a digest of the canonical JSON is stable everywhere.
+        filters_digest = hashlib.blake2b(orjson.dumps(filters, option=orjson.OPT_SORT_KEYS), digest_size=8).hexdigest()
+        cache_key = f"portfolio_data_p{page}_l{limit}_{filters_digest}"
+        
+        def load_response():
+            logger.info(f"Fetching portfolio data - Page: {page}, Limit: {limit}, Filters: {filters}")
+        
+            hierarchy_results, investment_results, has_more = _run_page_queries('portfolio', filters, page, limit)
+        
+            # Structure response
+            response_data = {
+                'status': 'success',
+                'data': {
+                    'hierarchy': hierarchy_results,
+                    'investment': investment_results,
+                    'pagination': {
+                        'page': page,
+                        'limit': limit,
+                        'total_items': len(hierarchy_results),
+                        'has_more': has_more
+                    }
+                },
+                'mode': 'databricks',
+                'cache_info': {
+                    'cached': False,
+                    'cache_key': cache_key
                 }
-            },
-            'mode': 'databricks',
-            'cache_info': {
-                'cached': False,
-                'cache_key': cache_key
             }
-        }
+            return response_data
         
-        # Cache the response
-        cache_service.set(cache_key, response_data, timeout=300)  # 5 minutes
+        # Only one request per cold key runs the queries; concurrent ones wait for its result
+        response_data = cache_service.get_or_compute(cache_key, load_response, ttl=300)  # 5 minutes
         
         return jsonify(response_data)
         
@@ -102,56 +208,34 @@ def get_program_data():
         
         cache_key = f"program_data_{portfolio_id}_p{page}_l{limit}"
         
-        # Check cache first
-        cached_data = cache_service.get(cache_key)
-        if cached_data:
-            logger.info(f"Serving program data from cache: {cache_key}")
-            return jsonify(cached_data)
-        
-        logger.info(f"Fetching program data for portfolio: {portfolio_id}")
-        
-        # Read and modify SQL queries for program-level data
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read()
-        
-        with open(INVESTMENT_QUERY_FILE, 'r') as f:
-            investment_query = f.read()
-        
-        # Filter for specific portfolio and program level
-        hierarchy_query += f" AND COE_ROADMAP_PARENT_ID = '{portfolio_id}' AND COE_ROADMAP_TYPE = 'Program'"
-        investment_query += f" AND INVESTMENT_ID LIKE '{portfolio_id}%'"
-        
-        # Add pagination
-        offset = (page - 1) * limit
-        hierarchy_query += f" ORDER BY COE_ROADMAP_ELEMENT_ID OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-        investment_query += f" ORDER BY INVESTMENT_ID OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-        
-        # Execute queries
-        hierarchy_results = databricks_client.execute_query(hierarchy_query)
-        investment_results = databricks_client.execute_query(investment_query)
-        
-        response_data = {
-            'status': 'success',
-            'data': {
-                'hierarchy': hierarchy_results,
-                'investment': investment_results,
-                'pagination': {
-                    'page': page,
-                    'limit': limit,
-                    'portfolio_id': portfolio_id,
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+        def load_response():
+            logger.info(f"Fetching program data for portfolio: {portfolio_id}")
+        
+            hierarchy_results, investment_results, has_more = _run_page_queries('program', {'portfolio_id': portfolio_id}, page, limit)
+        
+            response_data = {
+                'status': 'success',
+                'data': {
+                    'hierarchy': hierarchy_results,
+                    'investment': investment_results,
+                    'pagination': {
+                        'page': page,
+                        'limit': limit,
+                        'portfolio_id': portfolio_id,
+                        'total_items': len(hierarchy_results),
+                        'has_more': has_more
+                    }
+                },
+                'mode': 'databricks',
+                'cache_info': {
+                    'cached': False,
+                    'cache_key': cache_key
                 }
-            },
-            'mode': 'databricks',
-            'cache_info': {
-                'cached': False,
-                'cache_key': cache_key
             }
-        }
+            return response_data
         
-        # Cache the response
-        cache_service.set(cache_key, response_data, timeout=300)
+        # Only one request per cold key runs the queries; concurrent ones wait for its result
+        response_data = cache_service.get_or_compute(cache_key, load_response, ttl=300)  # 5 minutes
         
         return jsonify(response_data)
         
@@ -180,62 +264,34 @@ def get_subprogram_data():
         
         cache_key = f"subprogram_data_{program_id}_p{page}_l{limit}"
         
-        # Check cache first
-        cached_data = cache_service.get(cache_key)
-        if cached_data:
-            logger.info(f"Serving subprogram data from cache: {cache_key}")
-            return jsonify(cached_data)
-        
-        logger.info(f"Fetching subprogram data for program: {program_id}")
-        
-        # Read and modify SQL queries for subprogram-level data
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read()
-        
-        with open(INVESTMENT_QUERY_FILE, 'r') as f:
-            investment_query = f.read()
-        
-        # Filter for specific program and subprogram level, or all if program_id is 'ALL'
-        if program_id.upper() == 'ALL':
-            # Load all sub-program data
-            hierarchy_query += " AND COE_ROADMAP_TYPE = 'SubProgram'"
-            # Don't filter investment query for specific program
-        else:
-            # Filter for specific program and subprogram level
-            hierarchy_query += f" AND COE_ROADMAP_PARENT_ID = '{program_id}' AND COE_ROADMAP_TYPE = 'SubProgram'"
-            investment_query += f" AND INVESTMENT_ID LIKE '{program_id}%'"
-        
-        # Add pagination
-        offset = (page - 1) * limit
-        hierarchy_query += f" ORDER BY COE_ROADMAP_ELEMENT_ID OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-        investment_query += f" ORDER BY INVESTMENT_ID OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-        
-        # Execute queries
-        hierarchy_results = databricks_client.execute_query(hierarchy_query)
-        investment_results = databricks_client.execute_query(investment_query)
-        
-        response_data = {
-            'status': 'success',
-            'data': {
-                'hierarchy': hierarchy_results,
-                'investment': investment_results,
-                'pagination': {
-                    'page': page,
-                    'limit': limit,
-                    'program_id': program_id,
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+        def load_response():
+            logger.info(f"Fetching subprogram data for program: {program_id}")
+        
+            hierarchy_results, investment_results, has_more = _run_page_queries('subprogram', {'program_id': program_id}, page, limit)
+        
+            response_data = {
+                'status': 'success',
+                'data': {
+                    'hierarchy': hierarchy_results,
+                    'investment': investment_results,
+                    'pagination': {
+                        'page': page,
+                        'limit': limit,
+                        'program_id': program_id,
+                        'total_items': len(hierarchy_results),
+                        'has_more': has_more
+                    }
+                },
+                'mode': 'databricks',
+                'cache_info': {
+                    'cached': False,
+                    'cache_key': cache_key
                 }
-            },
-            'mode': 'databricks',
-            'cache_info': {
-                'cached': False,
-                'cache_key': cache_key
             }
-        }
+            return response_data
         
-        # Cache the response
-        cache_service.set(cache_key, response_data, timeout=300)
+        # Only one request per cold key runs the queries; concurrent ones wait for its result
+        response_data = cache_service.get_or_compute(cache_key, load_response, ttl=300)  # 5 minutes
         
         return jsonify(response_data)
         
@@ -258,57 +314,34 @@ def get_region_data():
         
         cache_key = f"region_data_{region or 'all'}_p{page}_l{limit}"
         
-        # Check cache first
-        cached_data = cache_service.get(cache_key)
-        if cached_data:
-            logger.info(f"Serving region data from cache: {cache_key}")
-            return jsonify(cached_data)
-        
-        logger.info(f"Fetching region data - Region: {region}, Page: {page}, Limit: {limit}")
-        
-        # Read and modify SQL queries for region-level data
-        with open(HIERARCHY_QUERY_FILE, 'r') as f:
-            hierarchy_query = f.read()
-        
-        with open(INVESTMENT_QUERY_FILE, 'r') as f:
-            investment_query = f.read()
-        
-        # Filter by region if specified
-        if region:
-            hierarchy_query += f" AND REGION = '{region}'"
-            investment_query += f" AND REGION = '{region}'"
-        
-        # Add pagination
-        offset = (page - 1) * limit
-        hierarchy_query += f" ORDER BY COE_ROADMAP_ELEMENT_ID OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-        investment_query += f" ORDER BY INVESTMENT_ID OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY"
-        
-        # Execute queries
-        hierarchy_results = databricks_client.execute_query(hierarchy_query)
-        investment_results = databricks_client.execute_query(investment_query)
-        
-        response_data = {
-            'status': 'success',
-            'data': {
-                'hierarchy': hierarchy_results,
-                'investment': investment_results,
-                'pagination': {
-                    'page': page,
-                    'limit': limit,
-                    'region': region,
-                    'total_items': len(hierarchy_results),
-                    'has_more': len(hierarchy_results) == limit
+        def load_response():
+            logger.info(f"Fetching region data - Region: {region}, Page: {page}, Limit: {limit}")
+        
+            hierarchy_results, investment_results, has_more = _run_page_queries('region', {'region': region} if region else {}, page, limit)
+        
+            response_data = {
+                'status': 'success',
+                'data': {
+                    'hierarchy': hierarchy_results,
+                    'investment': investment_results,
+                    'pagination': {
+                        'page': page,
+                        'limit': limit,
+                        'region': region,
+                        'total_items': len(hierarchy_results),
+                        'has_more': has_more
+                    }
+                },
+                'mode': 'databricks',
+                'cache_info': {
+                    'cached': False,
+                    'cache_key': cache_key
                 }
-            },
-            'mode': 'databricks',
-            'cache_info': {
-                'cached': False,
-                'cache_key': cache_key
             }
-        }
+            return response_data
         
-        # Cache the response
-        cache_service.set(cache_key, response_data, timeout=300)
+        # Only one request per cold key runs the queries; concurrent ones wait for its result
+        response_data = cache_service.get_or_compute(cache_key, load_response, ttl=300)  # 5 minutes
         
         return jsonify(response_data)
         
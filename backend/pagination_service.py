@@ -4,10 +4,34 @@ Provides intelligent pagination with configurable page sizes.
 """
 import logging
 import math
-from typing import Dict, List, Any, Optional
+import re
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Window column added by `add_pagination_to_query(..., with_total_count=True)`
+TOTAL_COUNT_COLUMN = '_total_count'
+
+# A LIMIT keyword (not e.g. CREDIT_LIMIT) with no unbalanced closing paren after it,
+# i.e. the outermost query's own trailing LIMIT/OFFSET clause rather than one in a
+# subquery. Balanced parens are allowed so %(limit)s placeholders still match.
+_TRAILING_LIMIT_RE = re.compile(r'\bLIMIT\b(?:[^()]|\([^()]*\))*$', re.IGNORECASE)
+
+
+@lru_cache(maxsize=64)
+def _strip_limit(query: str) -> str:
+    """
+    Drop a trailing LIMIT/OFFSET clause and semicolon from a query.
+    
+    Memoized because the same multi-KB base queries are paginated over and over and
+    scanning them for LIMIT on every call is wasted work.
+    """
+    match = _TRAILING_LIMIT_RE.search(query)
+    if match:
+        query = query[:match.start()].rstrip()
+    return query.rstrip(';')
+
 
 class PaginationService:
     """
@@ -18,17 +42,27 @@ class PaginationService:
         self.default_page_size = default_page_size
         self.max_page_size = max_page_size
     
-    def add_pagination_to_query(self, query: str, page: int = 1, page_size: int = None) -> str:
+    def add_pagination_to_query(
+        self,
+        query: str,
+        page: int = 1,
+        page_size: int = None,
+        with_total_count: bool = False
+    ) -> Tuple[str, Dict[str, int]]:
         """
         Add LIMIT and OFFSET clauses to a SQL query for pagination.
         
+        The clauses use bind markers so every page of a query shares one query plan.
+        
         Args:
             query: Original SQL query
             page: Page number (1-based)
             page_size: Number of records per page
+            with_total_count: Also return the unpaginated row count in a
+                TOTAL_COUNT_COLUMN window column, read back with `pop_total_count`
             
         Returns:
-            Modified query with pagination
+            Tuple of (modified query with pagination, parameters for its LIMIT/OFFSET markers)
         """
         page_size = min(page_size or self.default_page_size, self.max_page_size)
         page = max(1, page)  # Ensure page is at least 1
@@ -36,22 +70,25 @@ class PaginationService:
         offset = (page - 1) * page_size
         
         # Remove existing LIMIT/OFFSET clauses if any
-        query_upper = query.upper()
-        if 'LIMIT' in query_upper:
-            # Find the position of LIMIT and remove everything after it
-            limit_pos = query_upper.rfind('LIMIT')
-            query = query[:limit_pos].rstrip()
+        query = _strip_limit(query)
+        if with_total_count:
+            # COUNT(*) OVER () is evaluated before LIMIT, so the page and the total come
+            # back from a single scan instead of a separate COUNT(*) query
+            query = f"SELECT *, COUNT(*) OVER () AS {TOTAL_COUNT_COLUMN} FROM ({query}) AS page_base"
         
         # Add new pagination
-        paginated_query = f"{query.rstrip(';')}\nLIMIT {page_size} OFFSET {offset};"
+        paginated_query = f"{query}\nLIMIT %(limit)s OFFSET %(offset)s;"
         
         logger.info(f"📄 Added pagination: page={page}, page_size={page_size}, offset={offset}")
-        return paginated_query
+        return paginated_query, {'limit': page_size, 'offset': offset}
     
     def get_count_query(self, original_query: str) -> str:
         """
         Generate a COUNT query from the original query to get total records.
         
+        This runs the whole query a second time; prefer `with_total_count=True` on
+        `add_pagination_to_query` when the page is being fetched anyway.
+        
         Args:
             original_query: The original SELECT query
             
@@ -59,12 +96,7 @@ class PaginationService:
             COUNT query to get total number of records
         """
         # Remove LIMIT/OFFSET clauses
-        query_upper = original_query.upper()
-        if 'LIMIT' in query_upper:
-            limit_pos = query_upper.rfind('LIMIT')
-            query = original_query[:limit_pos].rstrip()
-        else:
-            query = original_query.rstrip(';')
+        query = _strip_limit(original_query)
         
         # Wrap in COUNT query
         count_query = f"SELECT COUNT(*) as total_count FROM ({query}) as count_subquery;"
@@ -72,6 +104,17 @@ class PaginationService:
         logger.info("🔢 Generated count query for pagination")
         return count_query
     
+    def pop_total_count(self, rows: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Strip the TOTAL_COUNT_COLUMN window column from a page of rows and return its value.
+        
+        Returns None for an empty page, where the window column carries no value.
+        """
+        total_count = rows[0].get(TOTAL_COUNT_COLUMN) if rows else None
+        for row in rows:
+            row.pop(TOTAL_COUNT_COLUMN, None)
+        return total_count
+    
     def create_pagination_metadata(
         self, 
         total_count: int, 
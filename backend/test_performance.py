@@ -3,20 +3,31 @@
 Quick performance test for API endpoints
 """
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import json
 
 BASE_URL = "http://localhost:5000"
 
+# One pooled session so requests reuse keep-alive connections instead of reconnecting
+session = requests.Session()
+
+ENDPOINTS = [
+    ("/api/health", "Health Check"),
+    ("/api/test-connection", "Databricks Connection"),
+    ("/api/hierarchy_data", "Hierarchy Data (311 line query)"),  # smaller query
+    ("/api/investment_data", "Investment Data (785 line query)")  # larger query
+]
+
 def test_endpoint(endpoint, description):
-    """Test an endpoint and measure response time."""
-    print(f"\n🧪 Testing {description}...")
-    print(f"📍 Endpoint: {endpoint}")
+    """Test an endpoint and measure response time. Returns the report lines."""
+    lines = [f"\n🧪 Testing {description}...", f"📍 Endpoint: {endpoint}"]
+    report = lines.append  # Collect output so concurrent tests don't interleave
     
     start_time = time.time()
     
     try:
-        response = requests.get(f"{BASE_URL}{endpoint}", timeout=1800)  # 30 minute timeout
+        response = session.get(f"{BASE_URL}{endpoint}", timeout=1800)  # 30 minute timeout
         end_time = time.time()
         
         elapsed = end_time - start_time
@@ -24,36 +35,35 @@ def test_endpoint(endpoint, description):
         if response.status_code == 200:
             data = response.json()
             if 'count' in data:
-                print(f"✅ Success: {data['count']} records in {elapsed:.2f} seconds")
+                report(f"✅ Success: {data['count']} records in {elapsed:.2f} seconds")
             else:
-                print(f"✅ Success in {elapsed:.2f} seconds")
+                report(f"✅ Success in {elapsed:.2f} seconds")
             
             if 'data' in data:
-                print(f"📊 Sample data keys: {list(data['data'][0].keys()) if data['data'] else 'No data'}")
+                report(f"📊 Sample data keys: {list(data['data'][0].keys()) if data['data'] else 'No data'}")
         else:
-            print(f"❌ Failed: HTTP {response.status_code}")
-            print(f"🔍 Response: {response.text}")
+            report(f"❌ Failed: HTTP {response.status_code}")
+            report(f"🔍 Response: {response.text}")
             
     except requests.exceptions.Timeout:
-        print(f"⏰ Timeout after 30 minutes")
+        report(f"⏰ Timeout after 30 minutes")
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
+        report(f"❌ Error: {str(e)}")
+    
+    return lines
 
 if __name__ == "__main__":
     print("🚀 PMO Portfolio API Performance Test")
     print("=" * 50)
     
-    # Test health first
-    test_endpoint("/api/health", "Health Check")
-    
-    # Test connection
-    test_endpoint("/api/test-connection", "Databricks Connection")
-    
-    # Test hierarchy data (smaller query)
-    test_endpoint("/api/hierarchy_data", "Hierarchy Data (311 line query)")
+    # Run the endpoints concurrently so the total is the slowest one, not the sum
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=len(ENDPOINTS)) as executor:
+        reports = list(executor.map(lambda args: test_endpoint(*args), ENDPOINTS))
     
-    # Test investment data (larger query)  
-    test_endpoint("/api/investment_data", "Investment Data (785 line query)")
+    for lines in reports:
+        print("\n".join(lines))
     
+    print(f"\n⏱️ All {len(ENDPOINTS)} endpoints finished in {time.time() - start_time:.2f} seconds")
     print("\n" + "=" * 50)
     print("🏁 Performance test completed!")
@@ -9,7 +9,7 @@ def test_filter_query():
     print("🔍 Testing filter options query directly...")
     
     try:
-        # The exact query from the backend
+        # Filter options query, aggregated per facet in Databricks
         filter_query = """
         WITH investment_data AS (
             SELECT DISTINCT
@@ -21,14 +21,14 @@ def test_filter_query():
             AND INV_MARKET != ''
             AND CLRTY_INV_TYPE IN ('Non-Clarity item', 'Project', 'Programs')
         )
-        SELECT DISTINCT
-            SPLIT(INV_MARKET, '/')[0] as region,
-            SPLIT(INV_MARKET, '/')[1] as market,
-            INV_FUNCTION as function,
-            CAST(INV_TIER as STRING) as tier
+        -- Databricks builds each facet's distinct, sorted values, so one row comes back
+        SELECT
+            array_sort(collect_set(SPLIT(INV_MARKET, '/')[0])) as regions,
+            array_sort(collect_set(SPLIT(INV_MARKET, '/')[1])) as markets,
+            array_sort(collect_set(INV_FUNCTION)) as functions,
+            array_sort(collect_set(CAST(INV_TIER as STRING))) as tiers
         FROM investment_data
         WHERE INV_MARKET IS NOT NULL AND INV_MARKET != ''
-        LIMIT 10
         """
         
         print("Query to execute:")
@@ -42,27 +42,18 @@ def test_filter_query():
         for i, row in enumerate(results):
             print(f"  Row {i+1}: {row}")
         
-        # Process results like the backend does
-        regions = set()
-        markets = set() 
-        functions = set()
-        tiers = set()
-        
-        for row in results:
-            if row.get('region'):
-                regions.add(row['region'])
-            if row.get('market'):
-                markets.add(row['market'])
-            if row.get('function'):
-                functions.add(row['function'])
-            if row.get('tier'):
-                tiers.add(row['tier'])
+        # collect_set skips NULLs; drop empty strings as the backend does
+        facets = results[0] if results else {}
+        regions, markets, functions, tiers = (
+            [value for value in facets.get(name) or [] if value]
+            for name in ('regions', 'markets', 'functions', 'tiers')
+        )
         
         print(f"\nProcessed results:")
-        print(f"  - Regions: {sorted(list(regions))}")
-        print(f"  - Markets: {sorted(list(markets))}")
-        print(f"  - Functions: {sorted(list(functions))}")
-        print(f"  - Tiers: {sorted(list(tiers))}")
+        print(f"  - Regions: {regions}")
+        print(f"  - Markets: {markets}")
+        print(f"  - Functions: {functions}")
+        print(f"  - Tiers: {tiers}")
         
     except Exception as e:
         print(f"❌ Error: {str(e)}")